@@ -0,0 +1,71 @@
+# Synthetic boards for the FPGA Builder benchmarks.
+#
+# Boards are generated as project data, the same structure that
+# MainWindow.project_data() returns, so they can be written to disk and loaded
+# through the normal code paths.
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from visualfpga27 import PROJECT_VERSION, GRID_SIZE
+
+PART_TYPES = [
+    # component_type, chip_type, width, height, pin_count, pin_orientation
+    ("IC Chip", "Regular", 100, 50, 8, "left-right"),
+    ("IC Chip", "Wide", 150, 50, 16, "top-bottom"),
+    ("IC Chip", "Square", 100, 100, 32, "all-sides"),
+    ("Capacitor", "Regular", 20, 40, 2, "left-right"),
+    ("Resistor", "Regular", 60, 20, 2, "left-right"),
+    ("Crystal Oscillator", "Regular", 40, 60, 4, "left-right"),
+    ("DIP Switch", "Regular", 80, 30, 8, "top-bottom"),
+]
+
+
+def synthetic_project(parts, connections=None, seed=0):
+    """Build project data with the given number of parts and connections.
+
+    Parts are laid out on a square grid. Without a connection count every part
+    is wired to the next one; otherwise each wire joins a part to one of its
+    neighbours within a row, like the local wiring of a real board.
+    """
+    rng = random.Random(seed)
+    columns = max(1, int(parts ** 0.5))
+    components = []
+    for index in range(parts):
+        component_type, chip_type, width, height, pin_count, pin_orientation = rng.choice(PART_TYPES)
+        components.append({
+            "id": "part%d" % index,
+            "label": "U%d" % index,
+            "component_type": component_type,
+            "chip_type": chip_type,
+            "width": width,
+            "height": height,
+            "pin_count": pin_count,
+            "pin_orientation": pin_orientation,
+            "rotation": rng.choice([0, 90, 180, 270]),
+            "x": float((index % columns) * GRID_SIZE * 10),
+            "y": float((index // columns) * GRID_SIZE * 10)
+        })
+
+    if connections is None:
+        pairs = [(index - 1, index) for index in range(1, parts)]
+    else:
+        pairs = []
+        for _ in range(connections if parts > 1 else 0):
+            source = rng.randrange(parts - 1)
+            pairs.append((source, min(parts - 1, source + rng.randint(1, columns))))
+
+    connection_data = []
+    for source_index, target_index in pairs:
+        source = components[source_index]
+        target = components[target_index]
+        connection_data.append({
+            "source_id": source["id"],
+            "source_pin_index": rng.randrange(source["pin_count"] // 2 * 2 or 1),
+            "target_id": target["id"],
+            "target_pin_index": rng.randrange(target["pin_count"] // 2 * 2 or 1)
+        })
+    return {"version": PROJECT_VERSION, "components": components, "connections": connection_data, "blocks": {}}
@@ -0,0 +1,291 @@
+# Editor hot-path benchmark for FPGA Builder.
+#
+# Generates a synthetic board and times the operations that make the editor
+# feel slow on large designs: loading and saving projects, rerouting wires
+# while a component is dragged, deleting components, replicating a part into
+# an array, exporting an image, repainting the view and searching the find
+# index. Results are written as JSON; pass an earlier result
+# file as --baseline to report regressions. The find queries are also timed
+# one by one on a much larger index of components and wires, and the run fails
+# when the slowest of them misses the search target. Runs headless on Qt's
+# offscreen platform:
+#
+#   python benchmarks/hotpaths.py --components 2000 --connections 4000 \
+#       --output results.json --baseline previous.json
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PyQt5.QtCore import QPointF, QT_VERSION_STR, PYQT_VERSION_STR
+from PyQt5.QtWidgets import QApplication
+
+from visualfpga27 import MainWindow, FPGAComponent, GRID_SIZE
+from boards import synthetic_project
+from search_index import SearchIndex
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+SEARCH_TARGET = 0.01  # Seconds per find query on the large board of components and wires
+
+
+def search_index(project):
+    """Index the components and wires of project under the texts the scene gives them, without creating items."""
+    index = SearchIndex()
+    labels = {}
+    for component in project["components"]:
+        labels[component["id"]] = component["label"]
+        index.add(component["id"], "%s (%s)" % (component["label"], component["component_type"]),
+                  component["label"], component["component_type"])
+    for number, connection in enumerate(project["connections"]):
+        name = "%s.%d - %s.%d" % (labels[connection["source_id"]], connection["source_pin_index"] + 1,
+                                  labels[connection["target_id"]], connection["target_pin_index"] + 1)
+        index.add(number, name, name)
+    index.prepare()  # As loading a project does
+    return index
+
+
+class Benchmark:
+    def __init__(self, window, directory, project, args):
+        self.window = window
+        self.project_path = os.path.join(directory, "board.fga")
+        self.output_path = os.path.join(directory, "output.fga")
+        self.image_path = os.path.join(directory, "board.png")
+        self.project = project
+        self.args = args
+        self.large_index = None
+        with open(self.project_path, "w") as file:
+            json.dump(project, file)
+
+    def components(self, count):
+        """The first count components of the loaded board, in insertion order."""
+        components = [item for item in self.window.scene.items() if isinstance(item, FPGAComponent)]
+        components.sort(key=lambda component: int(component.component_id[4:]))
+        return components[:count]
+
+    # Each task returns a function that runs the measured part, so the
+    # preparation work is not timed
+
+    def load_project(self):
+        return lambda: self.window.read_project(self.project_path)
+
+    def save_project(self):
+        self.window.read_project(self.project_path)
+        return lambda: self.window.write_project(self.output_path)
+
+    def drag(self):
+        self.window.read_project(self.project_path)
+        components = self.components(self.args.drag_components)
+
+        def run():
+            # Every step moves a component by one grid cell, like a mouse drag
+            for component in components:
+                start = component.pos()
+                for step in range(1, self.args.drag_steps + 1):
+                    component.setPos(start + QPointF(step * GRID_SIZE, 0))
+        return run
+
+    def delete_component(self):
+        self.window.read_project(self.project_path)
+        components = self.components(self.args.delete_components)
+
+        def run():
+            for component in components:
+                self.window.view.delete_component(component)
+        return run
+
+    def replicate(self):
+        self.window.read_project(self.project_path)
+        self.window.scene.clearSelection()
+        for component in self.components(1):
+            component.setSelected(True)
+        project_data = self.window.selection_data()
+        size = self.args.array_size
+        offsets = [(column * GRID_SIZE * 10, row * GRID_SIZE * 10) for row in range(size) for column in range(size)]
+        return lambda: self.window.add_items(project_data, offsets)
+
+    def save_image(self):
+        self.window.read_project(self.project_path)
+        return lambda: self.window.export_image(self.image_path)
+
+    def repaint(self):
+        self.window.read_project(self.project_path)
+        view = self.window.view
+        view.fitInView(self.window.scene.itemsBoundingRect())
+
+        def run():
+            for _ in range(self.args.repaints):
+                view.viewport().repaint()
+        return run
+
+    # Find panel queries: exact, prefix, typo, net name, two words and the
+    # common ones that match much of a large board
+    SEARCH_QUERIES = ["U137", "U1", "U13x7", "U12.3", "resistor U12", "ic chip", "u1 1"]
+
+    def large_search_index(self):
+        if self.large_index is None:
+            self.large_index = search_index(synthetic_project(self.args.search_components,
+                                                              self.args.search_connections))
+        return self.large_index
+
+    def search(self):
+        self.window.read_project(self.project_path)
+        indexes = [self.window.scene.search_index, self.large_search_index()]
+
+        def run():
+            for index in indexes:
+                for query in self.SEARCH_QUERIES:
+                    index.search(query, self.args.search_limit)
+        return run
+
+    def query_times(self):
+        """Return the median seconds of each find query on the large index."""
+        index = self.large_search_index()
+        times = {}
+        for query in self.SEARCH_QUERIES:
+            runs = []
+            for _ in range(self.args.repeat):
+                start = time.perf_counter()
+                index.search(query, self.args.search_limit)
+                runs.append(time.perf_counter() - start)
+            times[query] = statistics.median(runs)
+        return times
+
+    TASKS = ["load_project", "save_project", "drag", "delete_component", "replicate", "save_image", "repaint", "search"]
+
+    def measure(self, name):
+        runs = []
+        for _ in range(self.args.repeat):
+            run = getattr(self, name)()
+            start = time.perf_counter()
+            run()
+            runs.append(time.perf_counter() - start)
+
+        # Memory is measured in a separate run, tracing slows Python down
+        run = getattr(self, name)()
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"seconds": statistics.median(runs), "runs": runs, "peak_python_kb": peak // 1024}
+
+
+def compare(results, baseline, threshold):
+    """Print the change against a baseline result file and return the regressed tasks."""
+    regressions = []
+    for name, result in results["tasks"].items():
+        previous = baseline.get("tasks", {}).get(name)
+        if not previous or not previous["seconds"]:
+            continue
+        ratio = result["seconds"] / previous["seconds"]
+        flag = ""
+        if ratio > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("%-18s %9.4f s -> %9.4f s  (x%.2f)%s" % (name, previous["seconds"], result["seconds"], ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Editor hot-path benchmark")
+    parser.add_argument("--components", type=int, default=2000, help="number of components on the board")
+    parser.add_argument("--connections", type=int, default=4000, help="number of connections on the board")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per task, the median is reported")
+    parser.add_argument("--drag-components", type=int, default=10, help="components dragged in the drag task")
+    parser.add_argument("--drag-steps", type=int, default=20, help="grid steps per dragged component")
+    parser.add_argument("--delete-components", type=int, default=50, help="components removed in the delete task")
+    parser.add_argument("--array-size", type=int, default=32, help="rows and columns in the replicate task")
+    parser.add_argument("--repaints", type=int, default=10, help="viewport repaints in the repaint task")
+    parser.add_argument("--search-limit", type=int, default=200, help="results per query in the search task")
+    parser.add_argument("--search-components", type=int, default=60000,
+                        help="components on the large board the search task also queries")
+    parser.add_argument("--search-connections", type=int, default=40000,
+                        help="connections on the large board the search task also queries")
+    parser.add_argument("--search-target", type=float, default=SEARCH_TARGET,
+                        help="seconds per query on the large board that count as a pass")
+    parser.add_argument("--tasks", nargs="+", choices=Benchmark.TASKS, default=Benchmark.TASKS)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this earlier results file")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="slowdown factor against the baseline that counts as a regression")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    window = MainWindow(autosave=False)
+    window.resize(1280, 800)
+    window.show()
+    app.processEvents()
+
+    project = synthetic_project(args.components, args.connections)
+    results = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "qt": QT_VERSION_STR,
+            "pyqt": PYQT_VERSION_STR,
+            "platform": platform.platform(),
+            "components": args.components,
+            "connections": len(project["connections"]),
+            "repeat": args.repeat
+        },
+        "tasks": {}
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        benchmark = Benchmark(window, directory, project, args)
+        for name in args.tasks:
+            result = benchmark.measure(name)
+            results["tasks"][name] = result
+            print("%-18s %9.4f s  peak %8d KB" % (name, result["seconds"], result["peak_python_kb"]))
+        if "search" in args.tasks:
+            query_times = benchmark.query_times()
+            results["search_queries"] = {"components": args.search_components,
+                                         "connections": args.search_connections,
+                                         "target": args.search_target, "seconds": query_times}
+            for query, seconds in query_times.items():
+                print("  %-16s %8.1f ms" % (query, seconds * 1000))
+
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results["max_rss_kb"] = max_rss // 1024 if sys.platform == "darwin" else max_rss
+        print("max RSS: %d KB" % results["max_rss_kb"])
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    status = 0
+    if "search" in args.tasks:
+        query, seconds = max(results["search_queries"]["seconds"].items(), key=lambda item: item[1])
+        if seconds > args.search_target:
+            print("search for %r took %.1f ms and misses the %.0f ms target" %
+                  (query, seconds * 1000, args.search_target * 1000))
+            status = 1
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        print("\nChange against %s:" % args.baseline)
+        if compare(results, baseline, args.threshold):
+            status = 1
+
+    window.close()
+    app.quit()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
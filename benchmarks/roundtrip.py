@@ -0,0 +1,107 @@
+# Save/load round-trip benchmark for FPGA Builder project files.
+#
+# Loads the golden project, saves it again and checks that nothing changed,
+# checks that a version 1 file still compares and merges with what the editor
+# saves of it, then does the same for a synthetic board and reports the time
+# per 10k parts.
+# Runs headless on Qt's offscreen platform:
+#
+#   python benchmarks/roundtrip.py [--parts 10000]
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PyQt5.QtWidgets import QApplication
+
+from visualfpga27 import MainWindow, GRID_SIZE
+from project_diff import ProjectDiff, merge_projects
+from boards import synthetic_project
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden.fga")
+
+
+def round_trip(window, project_data):
+    """Write project data to disk, load it, save it again and return (result, load_time, save_time)."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "project.fga")
+        with open(path, "w") as file:
+            json.dump(project_data, file)
+
+        start = time.perf_counter()
+        window.read_project(path)
+        load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        window.write_project(path)
+        save_time = time.perf_counter() - start
+
+        with open(path, "r") as file:
+            return json.load(file), load_time, save_time
+
+
+def version_1_project(project_data):
+    """Return project data as version 1 files stored it: no ids or geometry, and wires by label."""
+    labels = {data["id"]: data["label"] for data in project_data["components"]}
+    return {
+        "components": [{field: data[field] for field in ("label", "pin_count", "pin_orientation", "x", "y")}
+                       for data in project_data["components"]],
+        "connections": [{"source_label": labels[data["source_id"]], "source_pin_index": data["source_pin_index"],
+                         "target_label": labels[data["target_id"]], "target_pin_index": data["target_pin_index"]}
+                        for data in project_data["connections"]]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Project save/load round-trip benchmark")
+    parser.add_argument("--parts", type=int, default=10000, help="number of parts in the synthetic board")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    window = MainWindow(autosave=False)
+
+    with open(GOLDEN_FILE, "r") as file:
+        golden = json.load(file)
+    result, _, _ = round_trip(window, golden)
+    if result != golden:
+        print("FAIL: golden project changed after save/load")
+        return 1
+    print("golden round trip: ok")
+
+    # Opening a version 1 file gives its parts new ids; the saved result must
+    # still match the old file part for part, and merge with other old copies
+    old = version_1_project(synthetic_project(100))
+    result, _, _ = round_trip(window, old)
+    diff = ProjectDiff(old, result)
+    if diff:
+        print("FAIL: version 1 project differs from its saved copy: %s" % "; ".join(diff.summary()[:5]))
+        return 1
+    theirs = json.loads(json.dumps(old))
+    theirs["components"][0]["x"] += GRID_SIZE
+    merged, conflicts = merge_projects(old, result, theirs)
+    if conflicts or len(merged["components"]) != len(old["components"]) or ProjectDiff(theirs, merged):
+        print("FAIL: version 1 project did not merge cleanly with its saved copy")
+        return 1
+    print("version 1 comparison: ok")
+
+    project = synthetic_project(args.parts)
+    result, load_time, save_time = round_trip(window, project)
+    if result != project:
+        print("FAIL: synthetic project changed after save/load")
+        return 1
+    scale = 10000.0 / args.parts
+    print("synthetic round trip: ok (%d parts, %d connections)" % (args.parts, len(project["connections"])))
+    print("load: %.3f s per 10k parts" % (load_time * scale))
+    print("save: %.3f s per 10k parts" % (save_time * scale))
+    app.quit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
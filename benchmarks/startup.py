@@ -0,0 +1,74 @@
+# Startup benchmark for FPGA Builder.
+#
+# Starts the editor in a fresh process several times, each time with
+# --profile-startup --exit-after-startup, and reports the median time of each
+# startup step. Fails when the median time to the first painted frame misses
+# the target. Runs headless on Qt's offscreen platform, with a temporary home
+# directory so no autosave journal of a real session is involved:
+#
+#   python benchmarks/startup.py --runs 5 --output startup.json
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from visualfpga27 import FIRST_FRAME_TARGET
+
+STEP_LINE = re.compile(r"^(.+?)\s+([\d.]+) ms  \(\+")
+
+
+def run_once(home):
+    env = dict(os.environ, HOME=home, USERPROFILE=home)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    result = subprocess.run([sys.executable, os.path.join(ROOT, "visualfpga27.py"), "--profile-startup",
+                             "--exit-after-startup"], env=env, stderr=subprocess.PIPE, universal_newlines=True,
+                            timeout=60)
+    if result.returncode != 0:
+        raise RuntimeError("editor exited with status %d:\n%s" % (result.returncode, result.stderr))
+    steps = {}
+    for line in result.stderr.splitlines():
+        match = STEP_LINE.match(line)
+        if match:
+            steps[match.group(1)] = float(match.group(2)) / 1000
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="editor starts, the median is reported")
+    parser.add_argument("--target", type=float, default=FIRST_FRAME_TARGET,
+                        help="seconds from start to the first frame that count as a pass")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    runs = []
+    with tempfile.TemporaryDirectory() as home:
+        for _ in range(args.runs):
+            runs.append(run_once(home))
+
+    results = {"target": args.target, "runs": runs, "median": {}}
+    for step in runs[0]:
+        results["median"][step] = statistics.median(run[step] for run in runs)
+        print("%-16s %8.1f ms" % (step, results["median"][step] * 1000))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    first_frame = results["median"]["first frame"]
+    if first_frame > args.target:
+        print("first frame after %.1f ms misses the %.0f ms target" % (first_frame * 1000, args.target * 1000))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+# Collaboration server and client for FPGA Builder.
+#
+# Editors share a design through a small asyncio TCP server. Every edit
+# travels as the same operations the autosave journal records (see
+# MainWindow.action_ops), so a change costs a few hundred bytes instead of
+# the whole project. Messages are compact JSON, one per line:
+#
+#   {"t": "state", "project": ..., "ops": [...], "seq": n}  server -> client on joining
+#   {"t": "snapshot", "project": ...}                       client -> server: replace the design
+#   {"t": "ops", "ops": [...]}                              client -> server: edits
+#   {"t": "ops", "ops": [...], "seq": n, "own": true}       server -> client: edits in server order
+#
+# The server decides the order of all edits. It numbers every batch it
+# receives and relays it to all clients, the sender included, so every client
+# sees the same edits in the same order. It keeps the design as a snapshot
+# plus the operations since then, folding the operations into the snapshot
+# from time to time so joining stays fast.
+#
+# A client shows its own edits at once, before the server has ordered them.
+# For moves, rotations and renames the last edit in server order wins: while
+# an edit of a component is still on its way to the server, the client drops
+# the collaborators' edits of the same kind for that component, since its own
+# will come after them. The client runs its event loop on a background thread
+# and gathers the edits made within BATCH_DELAY into one message.
+#
+# Run a server on this machine with:
+#
+#   python collab.py --port 8765
+
+import argparse
+import asyncio
+import json
+import queue
+import threading
+from collections import Counter
+
+DEFAULT_PORT = 8765
+BATCH_DELAY = 0.02  # Seconds edits are held back to be sent together
+COMPACT_THRESHOLD = 1000  # Operations after which the server folds them into its snapshot
+MESSAGE_LIMIT = 256 * 1024 * 1024  # Longest message line, snapshots of large boards included
+LAST_WRITER_WINS = ("move", "rotate", "rename")  # Operations that overwrite a property of a component
+
+
+def encode(message):
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def overwritten(op):
+    """Return what an operation overwrites as (kind, component id), or None if it does not overwrite anything."""
+    if op["op"] in LAST_WRITER_WINS:
+        return op["op"], op.get("id")
+    return None
+
+
+def apply_ops_to_project(project_data, ops):
+    """Apply edit operations to project data in place, without Qt.
+
+    Follows MainWindow.apply_ops_to: operations that refer to components
+    which do not exist are skipped.
+    """
+    components = {component["id"]: component for component in project_data["components"]}
+    connections = project_data["connections"]
+    blocks = project_data.setdefault("blocks", {})
+    for op in ops:
+        kind = op["op"]
+        if kind == "define_block":
+            blocks.setdefault(op["name"], op["project_data"])
+        elif kind == "add_component":
+            components.setdefault(op["component"]["id"], op["component"])
+        elif kind == "delete_component":
+            if components.pop(op["id"], None) is not None:
+                connections = [connection for connection in connections
+                               if op["id"] not in (connection["source_id"], connection["target_id"])]
+        elif kind == "add_connection":
+            connection = op["connection"]
+            if connection["source_id"] in components and connection["target_id"] in components:
+                connections.append(connection)
+        elif kind == "delete_connection":
+            if op["connection"] in connections:
+                connections.remove(op["connection"])
+        elif op.get("id") in components:
+            component = components[op["id"]]
+            if kind == "move":
+                component["x"], component["y"] = op["x"], op["y"]
+            elif kind == "rotate":
+                component["rotation"] = op["rotation"]
+            elif kind == "rename":
+                component["label"] = op["label"]
+    project_data["components"] = list(components.values())
+    project_data["connections"] = connections
+    return project_data
+
+
+class CollabServer:
+    def __init__(self, compact_threshold=COMPACT_THRESHOLD):
+        self.compact_threshold = compact_threshold
+        self.project = None  # Design as of the last compaction, None until a client shares one
+        self.ops = []  # Operations since then
+        self.sequence = 0  # Number of the last batch of operations relayed
+        self.clients = set()
+
+    async def handle(self, reader, writer):
+        self.clients.add(writer)
+        writer.write(encode({"t": "state", "project": self.project, "ops": self.ops, "seq": self.sequence}))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message["t"] == "ops":
+                    self.sequence += 1
+                    self.ops.extend(message["ops"])
+                    if self.project is not None and len(self.ops) >= self.compact_threshold:
+                        apply_ops_to_project(self.project, self.ops)
+                        self.ops = []
+                    relayed = {"t": "ops", "ops": message["ops"], "seq": self.sequence}
+                    self.broadcast(encode(relayed), writer)
+                    # The sender learns where its edits ended up in the order
+                    writer.write(encode(dict(relayed, own=True)))
+                elif message["t"] == "snapshot":
+                    self.project = message["project"]
+                    self.ops = []
+                    self.broadcast(encode({"t": "state", "project": self.project, "ops": [], "seq": self.sequence}),
+                                   writer)
+                await writer.drain()
+        except (ConnectionError, ValueError, KeyError):
+            pass  # A client that breaks the protocol or goes away is dropped
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    def broadcast(self, data, sender):
+        for writer in self.clients:
+            if writer is not sender:
+                writer.write(data)
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port, limit=MESSAGE_LIMIT)
+        async with server:
+            await server.serve_forever()
+
+
+class CollabClient:
+    """Connection to a collaboration server, run on a background thread.
+
+    Messages from the server are queued until the GUI collects them with
+    poll(). A lost connection shows up as a {"t": "closed"} message.
+    send_snapshot() may be called from any thread. send_ops() and poll() keep
+    track of the edits still on their way to the server, so they must be
+    called from the thread that applies the edits.
+    """
+
+    def __init__(self, host, port=DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.incoming = queue.Queue()
+        # Only touched by send_ops() and poll()
+        self.unconfirmed = Counter()  # overwritten() -> own operations the server has not sent back yet
+        self.in_flight = 0  # Own operations the server has not sent back yet
+        self.replay = 0  # Of those, the ones a newly received design does not hold yet
+        self.sequence = 0  # Number of the last batch of operations received
+        self.loop = asyncio.new_event_loop()
+        self.writer = None
+        # Only touched on the loop thread
+        self.pending = []  # Operations waiting for the next batch
+        self.outbox = []  # Messages sent before the connection was made
+        self.closing = False
+        self.flush_handle = None
+        self.thread = threading.Thread(target=self._run, name="CollabClient", daemon=True)
+        self.thread.start()
+
+    def send_ops(self, ops):
+        """Send edits that have already been applied here."""
+        if ops and self.thread.is_alive():
+            self.unconfirmed.update(key for key in map(overwritten, ops) if key is not None)
+            self.in_flight += len(ops)
+            self.loop.call_soon_threadsafe(self._add_ops, list(ops))
+
+    def send_snapshot(self, project_data):
+        if self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self._send, {"t": "snapshot", "project": project_data})
+
+    def poll(self):
+        """Return the messages received since the last call, with the edits still to be applied here."""
+        messages = []
+        while True:
+            try:
+                message = self.incoming.get_nowait()
+            except queue.Empty:
+                return messages
+            if message["t"] == "state":
+                self.sequence = message.get("seq", 0)
+                if message["project"] is not None or message["ops"]:
+                    # The design is replaced, own edits that come back from
+                    # now on are not in it and have to be applied again.
+                    # Otherwise this client starts the session from its own
+                    # design, which holds them.
+                    self.replay = self.in_flight
+            elif message["t"] == "ops":
+                if message["seq"] <= self.sequence:
+                    continue  # Already part of the design
+                self.sequence = message["seq"]
+                ops = message["ops"]
+                if message.get("own"):
+                    replayed = ops[:self.replay]
+                    self.replay -= len(replayed)
+                    self.in_flight -= len(ops)
+                    for key in map(overwritten, ops):
+                        if key is not None:
+                            self.unconfirmed[key] -= 1
+                            if not self.unconfirmed[key]:
+                                del self.unconfirmed[key]
+                    if not replayed:
+                        continue  # Shown here since they were made
+                    message = dict(message, ops=replayed)
+                else:
+                    # Own edits the server has still to order come after these
+                    message = dict(message, ops=[op for op in ops if overwritten(op) not in self.unconfirmed])
+            messages.append(message)
+
+    def close(self):
+        """Send what is still batched and disconnect."""
+        if self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self._stop)
+            self.thread.join(timeout=5)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._receive())
+        finally:
+            self.loop.close()
+
+    async def _receive(self):
+        try:
+            reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=MESSAGE_LIMIT)
+            for message in self.outbox:
+                self.writer.write(encode(message))
+            self.outbox = []
+            if self.closing:
+                return
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.incoming.put(json.loads(line))
+        except (OSError, ValueError) as error:
+            self.incoming.put({"t": "closed", "reason": str(error)})
+        except asyncio.CancelledError:
+            pass
+        else:
+            self.incoming.put({"t": "closed", "reason": "server closed the connection"})
+        finally:
+            if self.writer is not None:
+                writer, self.writer = self.writer, None
+                writer.close()
+                await writer.wait_closed()  # Lets the last batch go out
+
+    def _add_ops(self, ops):
+        self.pending.extend(ops)
+        if self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(BATCH_DELAY, self._flush)
+
+    def _flush(self):
+        self.flush_handle = None
+        if self.pending:
+            self._write({"t": "ops", "ops": self.pending})
+            self.pending = []
+
+    def _send(self, message):
+        self._flush()  # Keep the order of everything sent
+        self._write(message)
+
+    def _write(self, message):
+        if self.writer is None:
+            self.outbox.append(message)
+        else:
+            self.writer.write(encode(message))
+
+    def _stop(self):
+        self.closing = True
+        self._flush()
+        if self.writer is not None:
+            for task in asyncio.all_tasks(self.loop):
+                task.cancel()
+        # Otherwise the connection is still being made; _receive sends the
+        # outbox and stops once it is up
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FPGA Builder collaboration server")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+    args = parser.parse_args()
+    print("Serving FPGA Builder designs on %s:%d" % (args.host, args.port))
+    try:
+        asyncio.run(CollabServer().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# Autosave journal for FPGA Builder.
+#
+# Every edit is appended to the journal as one JSON line, so an edit costs a
+# small append instead of rewriting the whole project. Writes happen on a
+# background thread. From time to time the journal is compacted: the current
+# project is written as a snapshot and the journal starts over empty. After a
+# crash the snapshot plus the journal lines rebuild the last state.
+#
+# Every running editor has a session of its own: a journal, a snapshot and a
+# lock file named after the process. The editor holds the lock for as long as
+# it runs and the operating system drops it when the process ends, however it
+# ends. A session whose lock nobody holds belongs to an editor that is gone,
+# and only such sessions are offered for recovery.
+
+import json
+import os
+import queue
+import threading
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+JOURNAL_EXTENSION = ".journal"
+SNAPSHOT_EXTENSION = ".fga"
+LOCK_EXTENSION = ".lock"
+
+_SNAPSHOT = "snapshot"
+_DISCARD = "discard"
+
+
+class FileLock:
+    """An exclusive lock on a file, dropped when the holding process ends."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def acquire(self):
+        """Take the lock without waiting; return False if someone else holds it."""
+        self.file = open(self.path, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self.file.close()
+            self.file = None
+            return False
+        return True
+
+    def release(self):
+        if self.file is not None:
+            self.file.close()  # Closing the file drops the lock
+            self.file = None
+
+
+class JournalFiles:
+    """The journal, snapshot and lock file of one editor session."""
+
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self.journal_path = os.path.join(directory, name + JOURNAL_EXTENSION)
+        self.snapshot_path = os.path.join(directory, name + SNAPSHOT_EXTENSION)
+        self.lock = FileLock(os.path.join(directory, name + LOCK_EXTENSION))
+
+    def has_recovery_data(self):
+        return ((os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > 0) or
+                os.path.exists(self.snapshot_path))
+
+    def modified(self):
+        return max([os.path.getmtime(path) for path in (self.journal_path, self.snapshot_path)
+                    if os.path.exists(path)] or [0])
+
+    def read(self):
+        """Return (snapshot, ops) left behind by the session.
+
+        snapshot is the project data of the last compaction or None. A line
+        cut short by a crash is ignored together with everything after it.
+        """
+        snapshot = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as file:
+                snapshot = json.load(file)
+        ops = []
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r") as file:
+                for line in file:
+                    try:
+                        ops.append(json.loads(line))
+                    except ValueError:
+                        break
+        return snapshot, ops
+
+    def remove(self):
+        """Delete the session's files and let go of its lock."""
+        self.lock.release()  # Windows cannot delete a file that is open
+        for path in (self.journal_path, self.snapshot_path, self.lock.path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def claim_orphaned_session(directory):
+    """Return the newest session with recovery data whose editor is gone, or None.
+
+    The returned session's lock is held, so no other editor recovers it too.
+    Sessions of editors that are still running are left alone; orphaned
+    sessions without recovery data are removed.
+    """
+    try:
+        filenames = os.listdir(directory)
+    except FileNotFoundError:
+        return None
+    names = {os.path.splitext(filename)[0] for filename in filenames
+             if filename.endswith((JOURNAL_EXTENSION, SNAPSHOT_EXTENSION))}
+    sessions = []
+    for name in names:
+        session = JournalFiles(directory, name)
+        if not session.lock.acquire():
+            continue  # Its editor is still running
+        if session.has_recovery_data():
+            sessions.append(session)
+        else:
+            session.remove()
+    sessions.sort(key=JournalFiles.modified, reverse=True)
+    for session in sessions[1:]:
+        session.lock.release()  # Left for a later start
+    return sessions[0] if sessions else None
+
+
+class EditJournal(JournalFiles):
+    """The autosave journal of this editor, in a session of its own."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        # The process id names the session; the suffix keeps a reused id
+        # from taking over the files of an earlier, crashed process
+        super().__init__(directory, "autosave-%d-%s" % (os.getpid(), uuid.uuid4().hex[:8]))
+        self.lock.acquire()
+        self.pending = 0  # Entries recorded since the last compaction
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._writer, name="EditJournal", daemon=True)
+        self.thread.start()
+
+    def record(self, ops):
+        """Queue a list of edit operations to be appended to the journal."""
+        if ops:
+            self.pending += len(ops)
+            self.queue.put(ops)
+
+    def compact(self, project_data):
+        """Replace the journal with a snapshot of the whole project."""
+        self.pending = 0
+        self.queue.put((_SNAPSHOT, project_data))
+
+    def discard(self):
+        """Remove all recovery data, e.g. after a clean exit."""
+        self.pending = 0
+        self.queue.put((_DISCARD, None))
+
+    def close(self):
+        """Write everything still queued, stop the writer thread and end the session.
+
+        A session left without recovery data, as after discard(), is removed.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.has_recovery_data():
+            self.lock.release()
+        else:
+            self.remove()
+
+    def _writer(self):
+        journal = open(self.journal_path, "a")
+        try:
+            while True:
+                entry = self.queue.get()
+                batch = [entry]
+                # Group everything queued so far into one write and flush
+                while entry is not None:
+                    try:
+                        entry = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    batch.append(entry)
+                for entry in batch:
+                    if entry is None:
+                        return
+                    if isinstance(entry, tuple):
+                        journal.close()
+                        if entry[0] == _SNAPSHOT:
+                            self._write_snapshot(entry[1])
+                        elif os.path.exists(self.snapshot_path):
+                            os.remove(self.snapshot_path)
+                        journal = open(self.journal_path, "w")
+                    else:
+                        for op in entry:
+                            journal.write(json.dumps(op, separators=(",", ":")) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+        finally:
+            journal.close()
+
+    def _write_snapshot(self, project_data):
+        # Write to a temporary file first so a crash never leaves a half
+        # written snapshot behind
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(project_data, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.snapshot_path)
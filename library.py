@@ -0,0 +1,179 @@
+# Component library for FPGA Builder.
+#
+# Sizes and pin layouts of the built-in component types come from the tables
+# below instead of being spelled out where components are created. Pin layouts
+# are computed once per distinct shape and shared by every component with that
+# shape.
+#
+# Library parts, such as FPGA packages with named pins, are JSON files in the
+# library directory, one part per file, grouped into category subdirectories.
+# The directory is only scanned when the library is first used, and a part's
+# file is only read when that part is needed.
+
+import functools
+import json
+import os
+
+# Width and height of the built-in component types; IC chips depend on the chip type
+BUILTIN_SIZES = {
+    ("IC Chip", "Regular"): (100, 50),
+    ("IC Chip", "Wide"): (150, 50),
+    ("IC Chip", "Square"): (100, 100),
+    "Capacitor": (20, 40),
+    "Resistor": (60, 20),
+    "Inductor": (60, 20),
+    "Crystal Oscillator": (40, 60),
+    "Diode": (40, 40),
+    "Port": (40, 20),
+}
+
+# JEDEC ball rows skip letters that are easily confused with digits
+BGA_ROW_LETTERS = [letter for letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ" if letter not in "IOQSXZ"]
+
+
+def component_size(component_type, chip_type, pin_count):
+    """Return (width, height) for a new built-in component."""
+    if component_type == "DIP Switch":
+        return max(20, pin_count * 10), 30
+    if component_type == "IC Chip":
+        return BUILTIN_SIZES[(component_type, chip_type)]
+    return BUILTIN_SIZES[component_type]
+
+
+@functools.lru_cache(maxsize=None)
+def pin_layout(component_type, width, height, pin_count, pin_orientation):
+    """Return the (x, y) pin positions of a built-in component as a tuple."""
+    if component_type == "Port":
+        return ((width, height / 2),)
+
+    positions = []
+    if pin_orientation == 'left-right':
+        pin_spacing = height / (pin_count // 2 + 1)
+        for i in range(pin_count // 2):
+            positions.append((0, (i + 1) * pin_spacing))
+            positions.append((width, (i + 1) * pin_spacing))
+    elif pin_orientation == 'top-bottom':
+        pin_spacing = width / (pin_count // 2 + 1)
+        for i in range(pin_count // 2):
+            positions.append(((i + 1) * pin_spacing, 0))
+            positions.append(((i + 1) * pin_spacing, height))
+    else:  # all-sides
+        pins_per_side = max(1, pin_count // 4)  # Divide total pins by 4 for each side
+        extra_pins = pin_count % 4
+
+        # Top side
+        h_spacing = width / (pins_per_side + 1)
+        for i in range(pins_per_side + extra_pins):
+            positions.append(((i + 1) * h_spacing, 0))
+
+        # Bottom side
+        for i in range(pins_per_side):
+            positions.append(((i + 1) * h_spacing, height))
+
+        # Left side
+        v_spacing = height / (pins_per_side + 1)
+        for i in range(pins_per_side):
+            positions.append((0, (i + 1) * v_spacing))
+
+        # Right side
+        for i in range(pins_per_side):
+            positions.append((width, (i + 1) * v_spacing))
+    return tuple(positions)
+
+
+def bga_row_name(row):
+    """Return the JEDEC name of a ball row: A, B, ... Y, AA, AB, ..."""
+    letters = len(BGA_ROW_LETTERS)
+    if row < letters:
+        return BGA_ROW_LETTERS[row]
+    return BGA_ROW_LETTERS[row // letters - 1] + BGA_ROW_LETTERS[row % letters]
+
+
+class PartDefinition:
+    """A library part: body size and named pins, computed once from its file."""
+
+    def __init__(self, name, category, data):
+        self.name = name
+        self.category = category
+        self.description = data.get("description", "")
+        self.package = data["package"]
+        pin_names = data.get("pin_names", {})
+
+        package = self.package.upper()
+        if package in ("QFP", "TQFP", "LQFP", "QFN"):
+            self.width, self.height, pins = self.quad_pins(data["pins_per_side"], data["pitch"])
+        elif package == "BGA":
+            self.width, self.height, pins = self.bga_pins(data["rows"], data["columns"], data["pitch"])
+        elif package in ("DIP", "SOIC", "SOP", "TSOP", "SSOP"):
+            self.width, self.height, pins = self.dual_pins(data["pins_per_side"], data["pitch"], data["body_width"])
+        elif package == "CUSTOM":
+            self.width, self.height = data["width"], data["height"]
+            pins = [(str(pin["name"]), pin["x"], pin["y"]) for pin in data["pins"]]
+        else:
+            raise ValueError("%s: unknown package %r" % (name, self.package))
+
+        # pins holds (number, name, x, y); the name defaults to the pin number
+        self.pins = tuple((number, pin_names.get(number, number), x, y) for number, x, y in pins)
+
+    @staticmethod
+    def quad_pins(pins_per_side, pitch):
+        # Pin 1 is at the top of the left side, numbering runs counter-clockwise
+        size = (pins_per_side + 1) * pitch
+        pins = []
+        for i in range(pins_per_side):
+            pins.append((0, (i + 1) * pitch))
+        for i in range(pins_per_side):
+            pins.append(((i + 1) * pitch, size))
+        for i in range(pins_per_side):
+            pins.append((size, size - (i + 1) * pitch))
+        for i in range(pins_per_side):
+            pins.append((size - (i + 1) * pitch, 0))
+        return size, size, [(str(number + 1), x, y) for number, (x, y) in enumerate(pins)]
+
+    @staticmethod
+    def bga_pins(rows, columns, pitch):
+        pins = []
+        for row in range(rows):
+            for column in range(columns):
+                pins.append(("%s%d" % (bga_row_name(row), column + 1), (column + 1) * pitch, (row + 1) * pitch))
+        return (columns + 1) * pitch, (rows + 1) * pitch, pins
+
+    @staticmethod
+    def dual_pins(pins_per_side, pitch, body_width):
+        # Pin 1 is at the top of the left side, numbering runs counter-clockwise
+        height = (pins_per_side + 1) * pitch
+        pins = [(0, (i + 1) * pitch) for i in range(pins_per_side)]
+        pins += [(body_width, height - (i + 1) * pitch) for i in range(pins_per_side)]
+        return body_width, height, [(str(number + 1), x, y) for number, (x, y) in enumerate(pins)]
+
+
+class ComponentLibrary:
+    def __init__(self, directory):
+        self.directory = directory
+        self._index = None  # name -> (category, path), built on first use
+        self._parts = {}
+
+    def index(self):
+        """Return a dict of part name -> (category, path), scanning the directory once."""
+        if self._index is None:
+            self._index = {}
+            for root, _, files in os.walk(self.directory):
+                category = os.path.relpath(root, self.directory)
+                for filename in files:
+                    name, extension = os.path.splitext(filename)
+                    if extension == ".json":
+                        self._index.setdefault(name, ("" if category == "." else category, os.path.join(root, filename)))
+        return self._index
+
+    def names(self):
+        return sorted(self.index())
+
+    def get(self, name):
+        """Return the PartDefinition of a part, reading its file on first use."""
+        part = self._parts.get(name)
+        if part is None:
+            category, path = self.index()[name]
+            with open(path, "r") as file:
+                part = PartDefinition(name, category, json.load(file))
+            self._parts[name] = part
+        return part
@@ -0,0 +1,338 @@
+# Placement optimizer for FPGA Builder.
+#
+# Minimizes the total half-perimeter wirelength (HPWL) of the connections on a
+# board with simulated annealing. Every connection in the builder joins exactly
+# two pins, so the HPWL of a net is the Manhattan distance between its pins.
+#
+# The optimizer works on plain tuples so it can run in worker processes without
+# importing Qt:
+#
+#   blocks - one (x, y, left, top, width, height) tuple per component. x, y is the
+#            component position, left/top/width/height its bounding box relative
+#            to that position (after rotation).
+#   pins   - one (block_index, dx, dy) tuple per pin, dx/dy relative to the
+#            block position.
+#   nets   - one (pin_index, pin_index) tuple per connection.
+
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+GRID_SIZE = 20
+FILL_FACTOR = 0.5  # Share of the bounds fit_bounds() lets the blocks cover, leaving room to move them
+
+
+def total_wirelength(positions, pins, nets):
+    """Return the total HPWL of the nets for the given block positions."""
+    total = 0.0
+    for a, b in nets:
+        block_a, dx_a, dy_a = pins[a]
+        block_b, dx_b, dy_b = pins[b]
+        xa, ya = positions[block_a]
+        xb, yb = positions[block_b]
+        total += abs(xa + dx_a - xb - dx_b) + abs(ya + dy_a - yb - dy_b)
+    return total
+
+
+def block_area(blocks, grid=GRID_SIZE, spacing=1):
+    """Return the least area the blocks cover on the grid, spacing halos included."""
+    return sum((math.ceil(width / grid) + spacing) * (math.ceil(height / grid) + spacing)
+               for _, _, _, _, width, height in blocks) * grid * grid
+
+
+def fit_bounds(blocks, bounds, grid=GRID_SIZE, spacing=1):
+    """Grow bounds (x0, y0, x1, y1) about its centre until the blocks cover at most FILL_FACTOR of it.
+
+    The result is aligned to the grid and at least as wide and as tall as
+    the largest block.
+    """
+    x0, y0, x1, y1 = bounds
+    width = max([x1 - x0] + [(math.ceil(block[4] / grid) + spacing + 1) * grid for block in blocks])
+    height = max([y1 - y0] + [(math.ceil(block[5] / grid) + spacing + 1) * grid for block in blocks])
+    needed = block_area(blocks, grid, spacing) / FILL_FACTOR
+    if width * height < needed:
+        scale = math.sqrt(needed / (width * height))
+        width, height = width * scale, height * scale
+    centre_x, centre_y = (x0 + x1) / 2, (y0 + y1) / 2
+    return (math.floor((centre_x - width / 2) / grid) * grid, math.floor((centre_y - height / 2) / grid) * grid,
+            math.ceil((centre_x + width / 2) / grid) * grid, math.ceil((centre_y + height / 2) / grid) * grid)
+
+
+class _Annealer:
+    """Simulated annealing state for one optimization run."""
+
+    def __init__(self, blocks, pins, nets, grid, spacing, bounds, seed):
+        self.blocks = blocks
+        self.pins = pins
+        self.nets = nets
+        self.grid = grid
+        self.spacing = spacing
+        self.bounds = bounds
+        self.random = random.Random(seed)
+        self.xs = [block[0] for block in blocks]
+        self.ys = [block[1] for block in blocks]
+        self.occupied = {}
+
+        # Nets touching each block, so a move only re-evaluates its own wires
+        self.block_nets = [[] for _ in blocks]
+        for net_index, (a, b) in enumerate(nets):
+            block_a, block_b = pins[a][0], pins[b][0]
+            self.block_nets[block_a].append(net_index)
+            if block_b != block_a:
+                self.block_nets[block_b].append(net_index)
+
+    # Occupancy ----------------------------------------------------------
+
+    def cells(self, index, x, y):
+        """Grid cells covered by a block at (x, y), including its spacing halo."""
+        _, _, left, top, width, height = self.blocks[index]
+        grid = self.grid
+        col0 = math.floor((x + left) / grid)
+        row0 = math.floor((y + top) / grid)
+        col1 = math.ceil((x + left + width) / grid) + self.spacing
+        row1 = math.ceil((y + top + height) / grid) + self.spacing
+        return [(col, row) for col in range(col0, col1) for row in range(row0, row1)]
+
+    def in_bounds(self, index, x, y):
+        if self.bounds is None:
+            return True
+        _, _, left, top, width, height = self.blocks[index]
+        x0, y0, x1, y1 = self.bounds
+        return x + left >= x0 and y + top >= y0 and x + left + width <= x1 and y + top + height <= y1
+
+    def fits(self, index, x, y, ignore=()):
+        if not self.in_bounds(index, x, y):
+            return False
+        for cell in self.cells(index, x, y):
+            owner = self.occupied.get(cell)
+            if owner is not None and owner != index and owner not in ignore:
+                return False
+        return True
+
+    def occupy(self, index):
+        for cell in self.cells(index, self.xs[index], self.ys[index]):
+            self.occupied[cell] = index
+
+    def release(self, index):
+        for cell in self.cells(index, self.xs[index], self.ys[index]):
+            if self.occupied.get(cell) == index:
+                del self.occupied[cell]
+
+    def search_radius(self, index, x0, y0):
+        """Ring radius around (x0, y0) past which no position of the block is inside the bounds."""
+        if self.bounds is None:
+            return 10000
+        _, _, left, top, width, height = self.blocks[index]
+        bx0, by0, bx1, by1 = self.bounds
+        reach = max(abs(bx0 - x0 - left), abs(bx1 - x0 - left - width),
+                    abs(by0 - y0 - top), abs(by1 - y0 - top - height))
+        return math.ceil(reach / self.grid)
+
+    def legalize(self):
+        """Snap every block to the grid and resolve overlaps.
+
+        Blocks are placed top-left first at the nearest free grid position,
+        searching outwards in growing rings around their current location.
+        """
+        grid = self.grid
+        order = sorted(range(len(self.blocks)), key=lambda i: (self.ys[i], self.xs[i]))
+        # Placed blocks only ever fill more cells, so the rings in which a
+        # block found no room hold none for the next block of the same shape
+        # starting from the same spot either, as when many parts are stacked
+        first_ring = {}
+        for index in order:
+            x0 = round(self.xs[index] / grid) * grid
+            y0 = round(self.ys[index] / grid) * grid
+            limit = self.search_radius(index, x0, y0)
+            shape = (x0, y0) + tuple(self.blocks[index][2:])
+            radius = first_ring.get(shape, 0)
+            while True:
+                spot = None
+                for dx, dy in self.ring(radius):
+                    x, y = x0 + dx * grid, y0 + dy * grid
+                    if self.fits(index, x, y):
+                        distance = abs(dx) + abs(dy)
+                        if spot is None or distance < spot[0]:
+                            spot = (distance, x, y)
+                if spot is not None:
+                    self.xs[index], self.ys[index] = spot[1], spot[2]
+                    self.occupy(index)
+                    first_ring[shape] = radius
+                    break
+                radius += 1
+                if radius > limit:
+                    raise ValueError("No free position found for component %d" % index)
+
+    @staticmethod
+    def ring(radius):
+        """Grid offsets at Chebyshev distance radius from the origin."""
+        if radius == 0:
+            return [(0, 0)]
+        offsets = []
+        for d in range(-radius, radius + 1):
+            offsets.append((d, -radius))
+            offsets.append((d, radius))
+        for d in range(-radius + 1, radius):
+            offsets.append((-radius, d))
+            offsets.append((radius, d))
+        return offsets
+
+    # Cost ---------------------------------------------------------------
+
+    def net_cost(self, net_index):
+        a, b = self.nets[net_index]
+        block_a, dx_a, dy_a = self.pins[a]
+        block_b, dx_b, dy_b = self.pins[b]
+        return (abs(self.xs[block_a] + dx_a - self.xs[block_b] - dx_b) +
+                abs(self.ys[block_a] + dy_a - self.ys[block_b] - dy_b))
+
+    def nets_cost(self, net_indices):
+        return sum(self.net_cost(net_index) for net_index in net_indices)
+
+    def cost(self):
+        return self.nets_cost(range(len(self.nets)))
+
+    # Moves --------------------------------------------------------------
+
+    def try_move(self, index, x, y, temperature):
+        """Move one block if the annealing criterion accepts it and it fits."""
+        # The delta cost only touches this block's nets and is much cheaper
+        # than the occupancy check, so evaluate it first
+        nets = self.block_nets[index]
+        before = self.nets_cost(nets)
+        old_x, old_y = self.xs[index], self.ys[index]
+        self.xs[index], self.ys[index] = x, y
+        delta = self.nets_cost(nets) - before
+        self.xs[index], self.ys[index] = old_x, old_y
+        if not self.accept(delta, temperature) or not self.fits(index, x, y):
+            return 0.0
+        self.release(index)
+        self.xs[index], self.ys[index] = x, y
+        self.occupy(index)
+        return delta
+
+    def try_swap(self, first, second, temperature):
+        """Exchange the positions of two blocks if both fit afterwards."""
+        x1, y1 = self.xs[first], self.ys[first]
+        x2, y2 = self.xs[second], self.ys[second]
+        pair = (first, second)
+        if not self.fits(first, x2, y2, pair) or not self.fits(second, x1, y1, pair):
+            return 0.0
+        # The two blocks must not collide with each other either
+        first_cells = set(self.cells(first, x2, y2))
+        if first_cells.intersection(self.cells(second, x1, y1)):
+            return 0.0
+        nets = set(self.block_nets[first])
+        nets.update(self.block_nets[second])
+        before = self.nets_cost(nets)
+        self.xs[first], self.ys[first], self.xs[second], self.ys[second] = x2, y2, x1, y1
+        delta = self.nets_cost(nets) - before
+        self.xs[first], self.ys[first], self.xs[second], self.ys[second] = x1, y1, x2, y2
+        if not self.accept(delta, temperature):
+            return 0.0
+        self.release(first)
+        self.release(second)
+        self.xs[first], self.ys[first], self.xs[second], self.ys[second] = x2, y2, x1, y1
+        self.occupy(first)
+        self.occupy(second)
+        return delta
+
+    def accept(self, delta, temperature):
+        if delta <= 0:
+            return True
+        if temperature <= 0:
+            return False
+        return self.random.random() < math.exp(-delta / temperature)
+
+    def random_target(self, index, window):
+        grid = self.grid
+        steps = max(1, int(window / grid))
+        x = self.xs[index] + self.random.randint(-steps, steps) * grid
+        y = self.ys[index] + self.random.randint(-steps, steps) * grid
+        return x, y
+
+    def anneal(self, iterations):
+        count = len(self.blocks)
+        if count == 0 or not self.nets:
+            return self.cost()
+
+        xs = [self.xs[i] + self.blocks[i][2] for i in range(count)]
+        ys = [self.ys[i] + self.blocks[i][3] for i in range(count)]
+        span = max(max(xs) - min(xs), max(ys) - min(ys), self.grid * 4)
+
+        # Start hot enough to accept an average uphill move most of the time
+        samples = []
+        for _ in range(min(100, iterations)):
+            index = self.random.randrange(count)
+            x, y = self.random_target(index, span)
+            if self.fits(index, x, y):
+                nets = self.block_nets[index]
+                before = self.nets_cost(nets)
+                old = self.xs[index], self.ys[index]
+                self.xs[index], self.ys[index] = x, y
+                samples.append(abs(self.nets_cost(nets) - before))
+                self.xs[index], self.ys[index] = old
+        temperature = (sum(samples) / len(samples) if samples else 0) * 2 or self.grid
+        final_temperature = 0.01 * self.grid
+        cooling = (final_temperature / temperature) ** (1.0 / max(1, iterations))
+
+        start = (list(self.xs), list(self.ys))
+        start_cost = cost = self.cost()
+        for step in range(iterations):
+            # The move window shrinks with the temperature
+            window = max(self.grid, span * (1.0 - step / iterations))
+            index = self.random.randrange(count)
+            if count > 1 and self.random.random() < 0.2:
+                other = self.random.randrange(count)
+                if other != index:
+                    cost += self.try_swap(index, other, temperature)
+            else:
+                x, y = self.random_target(index, window)
+                cost += self.try_move(index, x, y, temperature)
+            temperature *= cooling
+
+        # The chain ends cold, so the final state is a local minimum; only
+        # fall back to the starting layout if annealing made things worse
+        if cost > start_cost:
+            self.xs, self.ys = start
+            return start_cost
+        return cost
+
+
+def _run(args):
+    blocks, pins, nets, iterations, grid, spacing, bounds, seed = args
+    annealer = _Annealer(blocks, pins, nets, grid, spacing, bounds, seed)
+    annealer.legalize()
+    cost = annealer.anneal(iterations)
+    return cost, list(zip(annealer.xs, annealer.ys))
+
+
+def optimize_placement(blocks, pins, nets, iterations=20000, workers=1, seed=None,
+                       grid=GRID_SIZE, spacing=1, bounds=None):
+    """Find grid-aligned, non-overlapping block positions with a short total wirelength.
+
+    Runs one independent annealing chain per worker, each in its own process
+    when workers > 1, and keeps the best result. spacing is the number of free
+    grid cells kept to the right of and below every block. bounds is an
+    optional (x0, y0, x1, y1) rectangle that the blocks must stay inside;
+    fit_bounds() makes one with room for the blocks.
+
+    Returns a list with one (x, y) position per block. Raises ValueError if
+    the blocks do not fit inside the bounds.
+    """
+    if not blocks:
+        return []
+    if bounds is not None:
+        x0, y0, x1, y1 = bounds
+        too_large = any(block[4] > x1 - x0 or block[5] > y1 - y0 for block in blocks)
+        if too_large or block_area(blocks, grid, spacing) > (x1 - x0) * (y1 - y0):
+            raise ValueError("The %d components do not fit inside the placement area" % len(blocks))
+    if seed is None:
+        seed = random.randrange(1 << 30)
+    jobs = [(blocks, pins, nets, iterations, grid, spacing, bounds, seed + i) for i in range(max(1, workers))]
+    if len(jobs) == 1:
+        results = [_run(jobs[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=len(jobs)) as executor:
+            results = list(executor.map(_run, jobs))
+    return min(results, key=lambda result: result[0])[1]
@@ -0,0 +1,116 @@
+# Opt-in instrumentation for FPGA Builder.
+#
+# Hot paths are wrapped with the profiled() decorator. While the profiler is
+# disabled the wrapper only checks a flag; while it is enabled every call is
+# timed, counted and kept as an event that can be written out in the Chrome
+# trace format (open it in chrome://tracing or https://ui.perfetto.dev).
+#
+# StartupProfile times the steps of program start against a timestamp taken
+# before the heavy imports.
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+MAX_EVENTS = 500000  # Trace events kept in memory, the oldest are dropped first
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.counters = defaultdict(int)
+        self.stats = {}  # Latest value of each measurement shown on the overlay
+        self.frame_times = deque(maxlen=60)
+        self.events = deque(maxlen=MAX_EVENTS)
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        if not enabled:
+            self.counters.clear()
+            self.stats.clear()
+            self.frame_times.clear()
+
+    def timestamp(self):
+        """Microseconds since the profiler was created."""
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def record(self, name, start, duration):
+        """Count one call of name and keep it as a complete trace event."""
+        self.counters[name] += 1
+        self.events.append({"name": name, "cat": "fpga", "ph": "X", "ts": start, "dur": duration,
+                            "pid": os.getpid(), "tid": threading.get_ident()})
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def take(self, name):
+        """Return a counter and reset it to zero."""
+        return self.counters.pop(name, 0)
+
+    def stat(self, name, value):
+        self.stats[name] = value
+        self.events.append({"name": name, "cat": "fpga", "ph": "C", "ts": self.timestamp(),
+                            "pid": os.getpid(), "args": {"value": value}})
+
+    def frame(self, duration):
+        """Record the duration of one repaint in microseconds."""
+        self.frame_times.append(duration)
+        self.stat("frame_ms", duration / 1000)
+
+    def average_frame_ms(self):
+        if not self.frame_times:
+            return 0.0
+        return sum(self.frame_times) / len(self.frame_times) / 1000
+
+    def dump_trace(self, filename):
+        with open(filename, "w") as file:
+            json.dump({"traceEvents": list(self.events), "displayTimeUnit": "ms"}, file)
+
+
+PROFILER = Profiler()
+
+
+class StartupProfile:
+    def __init__(self, origin):
+        self.origin = origin  # time.perf_counter() value taken as early as possible
+        self.marks = []  # (step, seconds since origin)
+
+    def mark(self, step):
+        """Record that step has just finished."""
+        self.marks.append((step, time.perf_counter() - self.origin))
+
+    def elapsed(self, step):
+        return dict(self.marks)[step]
+
+    def report(self, target_step=None, target=None):
+        """Return one line per step with its end time and duration, and the verdict on target_step."""
+        lines = []
+        previous = 0.0
+        for step, elapsed in self.marks:
+            lines.append("%-16s %8.1f ms  (+%.1f ms)" % (step, elapsed * 1000, (elapsed - previous) * 1000))
+            previous = elapsed
+        if target_step is not None and target is not None:
+            elapsed = self.elapsed(target_step)
+            lines.append("%s: %.1f ms, target %.0f ms: %s" % (target_step, elapsed * 1000, target * 1000,
+                                                             "ok" if elapsed <= target else "MISSED"))
+        return "\n".join(lines) + "\n"
+
+
+def profiled(name):
+    """Decorator that times and counts calls of a function while PROFILER is enabled."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            start = PROFILER.timestamp()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                PROFILER.record(name, start, PROFILER.timestamp() - start)
+        return wrapper
+    return decorator
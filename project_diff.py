@@ -0,0 +1,375 @@
+# Semantic diff and three-way merge of FPGA Builder projects.
+#
+# A .fga file is one line of JSON, so a text diff of two revisions says
+# nothing useful. Here both revisions are indexed by identity instead:
+# components by their id (or label, in version 1 files that have no ids) and
+# wires by the pair of pins they join, in either direction. The editor gives
+# the parts of a version 1 file new ids when it opens it, so when only some
+# of the files have ids, components without one are matched by label. Matching
+# is then a dict lookup per item, so comparing or merging takes time linear in
+# the size of the projects. The module does not need Qt:
+#
+#   python project_diff.py diff old.fga new.fga
+#   python project_diff.py merge base.fga ours.fga theirs.fga -o merged.fga
+#
+# diff exits with 1 when the projects differ, merge when there are conflicts,
+# and both exit with 2 when a file cannot be read, so they can gate a CI job.
+# merge also works as a git merge driver:
+#
+#   git config merge.fga.driver "python project_diff.py merge %O %A %B -o %A"
+#   echo "*.fga merge=fga" >> .gitattributes
+
+import argparse
+import json
+import sys
+from collections import Counter
+
+PLACEMENT_FIELDS = ("x", "y", "rotation")  # Fields whose change counts as a move
+# Fields that version 1 files do not store, with the values the editor loads them with
+VERSION_1_DEFAULTS = {"component_type": "IC Chip", "chip_type": "Regular", "width": 100, "height": 50, "rotation": 0}
+_MISSING = object()
+
+
+def component_key(data):
+    return data.get("id") or "label:%s" % data["label"]
+
+
+def connection_key(data, ids=None):
+    """Identity of a wire: its two (component key, pin index) ends, sorted so direction does not matter.
+
+    ids is {label: id} from matching_ids(), for wires of version 1 files.
+    """
+    if "source_id" in data:
+        source, target = data["source_id"], data["target_id"]
+    else:
+        # Version 1 files refer to components by label
+        ids = ids or {}
+        source = ids.get(data["source_label"]) or "label:%s" % data["source_label"]
+        target = ids.get(data["target_label"]) or "label:%s" % data["target_label"]
+    ends = (source, data["source_pin_index"]), (target, data["target_pin_index"])
+    return ends if ends[0] <= ends[1] else (ends[1], ends[0])
+
+
+def duplicate_labels(project_data):
+    """Return the labels that several components without an id share, as in version 1 files."""
+    counts = Counter(data["label"] for data in project_data["components"] if not data.get("id"))
+    return sorted(label for label, count in counts.items() if count > 1)
+
+
+def matching_ids(projects):
+    """Match the components without an id in some of the projects to those with one in the others.
+
+    Returns {label: id} for the labels that exactly one component has in
+    each project and that all the components with an id agree on, or None
+    if the projects all have ids or all have none, so there is nothing to
+    match.
+    """
+    ids, duplicates, unnamed = {}, set(), False
+    for project_data in projects:
+        labels = Counter()
+        for data in project_data["components"]:
+            labels[data["label"]] += 1
+            if not data.get("id"):
+                unnamed = True
+            elif ids.setdefault(data["label"], data["id"]) != data["id"]:
+                duplicates.add(data["label"])
+        duplicates.update(label for label, count in labels.items() if count > 1)
+    if not unnamed or not ids:
+        return None
+    return {label: component_id for label, component_id in ids.items() if label not in duplicates}
+
+
+def index_project(project_data, ids=None):
+    """Return ({component key: data}, {connection key: data}) in file order.
+
+    A label that several components without an id share refers, as in the
+    editor, to the last of them. The others are keyed by label and their
+    place among the components with that label, so they are still compared.
+
+    With ids from matching_ids(), components without an id are given the
+    fields and, where their label matches, the id they have in the other
+    projects, and their wires refer to them by id where both ends match.
+    """
+    remaining = Counter(data["label"] for data in project_data["components"] if not data.get("id"))
+    earlier = Counter()
+    components = {}
+    for data in project_data["components"]:
+        key = component_key(data)
+        if not data.get("id"):
+            label = data["label"]
+            remaining[label] -= 1
+            if remaining[label]:
+                earlier[label] += 1
+                key = "%s#%d" % (key, earlier[label])
+            if ids is not None:
+                data = dict(VERSION_1_DEFAULTS, **data)
+                if label in ids:
+                    key = data["id"] = ids[label]
+        components[key] = data
+    connections = {}
+    for data in project_data["connections"]:
+        key = connection_key(data, ids)
+        if ids is not None and "source_label" in data and data["source_label"] in ids and data["target_label"] in ids:
+            data = {"source_id": ids[data["source_label"]], "source_pin_index": data["source_pin_index"],
+                    "target_id": ids[data["target_label"]], "target_pin_index": data["target_pin_index"]}
+        connections[key] = data
+    return components, connections
+
+
+def placement(data):
+    return tuple(data.get(field, 0) for field in PLACEMENT_FIELDS)
+
+
+def component_name(data):
+    return data.get("label") or data.get("component_type", "component")
+
+
+class ProjectDiff:
+    """The differences from one revision of a project to another.
+
+    Components are reported as added, removed, moved (position or rotation),
+    changed (any other field) and rewired (kept, but with wires added or
+    removed). Wires are reported as added or removed by connection_key().
+    """
+
+    def __init__(self, old, new):
+        ids = matching_ids((old, new))
+        self.old_components, old_connections = index_project(old, ids)
+        self.new_components, new_connections = index_project(new, ids)
+        self.added = [key for key in self.new_components if key not in self.old_components]
+        self.removed = [key for key in self.old_components if key not in self.new_components]
+        self.moved = {}  # key -> ((x, y, rotation) before, after)
+        self.changed = {}  # key -> {field: (before, after)}
+        for key, data in self.new_components.items():
+            before = self.old_components.get(key)
+            if before is None or before == data:
+                continue
+            if placement(before) != placement(data):
+                self.moved[key] = (placement(before), placement(data))
+            fields = {}
+            for field in set(before) | set(data):
+                if field not in PLACEMENT_FIELDS and before.get(field) != data.get(field):
+                    fields[field] = (before.get(field), data.get(field))
+            if fields:
+                self.changed[key] = fields
+        self.added_connections = {key: data for key, data in new_connections.items() if key not in old_connections}
+        self.removed_connections = {key: data for key, data in old_connections.items() if key not in new_connections}
+        touched = {component for wire in list(self.added_connections) + list(self.removed_connections)
+                   for component, _ in wire}
+        self.rewired = [key for key in self.new_components if key in touched and key in self.old_components]
+        old_blocks, new_blocks = old.get("blocks", {}), new.get("blocks", {})
+        self.changed_blocks = sorted(name for name in set(old_blocks) | set(new_blocks)
+                                     if old_blocks.get(name) != new_blocks.get(name))
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.moved or self.changed or self.added_connections or
+                    self.removed_connections or self.changed_blocks)
+
+    def component_name(self, key):
+        return component_name(self.new_components.get(key) or self.old_components[key])
+
+    def wire_name(self, wire):
+        ends = []
+        for component, pin_index in wire:
+            data = self.new_components.get(component) or self.old_components.get(component)
+            ends.append("%s pin %d" % (component_name(data) if data else component, pin_index + 1))
+        return " - ".join(ends)
+
+    def counts(self):
+        return {
+            "added": len(self.added) + len(self.added_connections),
+            "removed": len(self.removed) + len(self.removed_connections),
+            "moved": len(self.moved),
+            "changed": len(self.changed) + len(self.changed_blocks),
+            "rewired": len(self.rewired),
+        }
+
+    def summary(self):
+        """Return the differences as lines of text, one per item."""
+        lines = []
+        for key in self.added:
+            lines.append("+ component %s" % self.component_name(key))
+        for key in self.removed:
+            lines.append("- component %s" % self.component_name(key))
+        for key, (before, after) in self.moved.items():
+            lines.append("> moved %s from (%g, %g) %g deg to (%g, %g) %g deg" % ((self.component_name(key),) + before + after))
+        for key, fields in self.changed.items():
+            changes = ", ".join("%s %r -> %r" % (field, before, after) for field, (before, after) in sorted(fields.items()))
+            lines.append("~ changed %s: %s" % (self.component_name(key), changes))
+        for key in self.rewired:
+            lines.append("* rewired %s" % self.component_name(key))
+        for wire in self.added_connections:
+            lines.append("+ wire %s" % self.wire_name(wire))
+        for wire in self.removed_connections:
+            lines.append("- wire %s" % self.wire_name(wire))
+        for name in self.changed_blocks:
+            lines.append("~ block definition %s" % name)
+        return lines
+
+    def to_json(self):
+        return {
+            "added": self.added,
+            "removed": self.removed,
+            "moved": {key: {"from": before, "to": after} for key, (before, after) in self.moved.items()},
+            "changed": {key: {field: {"from": before, "to": after} for field, (before, after) in fields.items()}
+                        for key, fields in self.changed.items()},
+            "rewired": self.rewired,
+            "added_connections": list(self.added_connections.values()),
+            "removed_connections": list(self.removed_connections.values()),
+            "changed_blocks": self.changed_blocks,
+        }
+
+
+def merge_value(base, ours, theirs):
+    """Three-way merge of one value: return (value, True if both sides changed it differently)."""
+    if ours == theirs or theirs == base:
+        return ours, False
+    if ours == base:
+        return theirs, False
+    return ours, True
+
+
+def merge_projects(base, ours, theirs):
+    """Three-way merge of two revisions of a project that share the base revision.
+
+    Returns (merged project data, conflicts), where conflicts is a list of
+    (component key or None, message). A field changed differently on both
+    sides keeps our value, and a component deleted on one side but changed
+    on the other is kept, so the merged project is always complete.
+    """
+    ids = matching_ids((base, ours, theirs))
+    base_components, base_connections = index_project(base, ids)
+    our_components, our_connections = index_project(ours, ids)
+    their_components, their_connections = index_project(theirs, ids)
+    conflicts = []
+
+    def name(key):
+        data = our_components.get(key) or their_components.get(key) or base_components.get(key)
+        return component_name(data) if data else key
+
+    components = {}
+    for key in list(our_components) + [key for key in their_components if key not in our_components]:
+        old, our, their = base_components.get(key), our_components.get(key), their_components.get(key)
+        if our == their:
+            components[key] = our  # Unchanged, or changed the same way on both sides
+            continue
+        if our is None or their is None:
+            kept = our if our is not None else their
+            if old is None:
+                components[key] = kept  # Added on one side
+            elif kept != old:
+                components[key] = kept
+                conflicts.append((key, "%s was deleted on one side and changed on the other; kept the changed one"
+                                  % name(key)))
+            continue
+        old = old or {}
+        data, clashes = {}, []
+        for field in list(our) + [field for field in their if field not in our]:
+            value, clash = merge_value(old.get(field, _MISSING), our.get(field, _MISSING), their.get(field, _MISSING))
+            if clash:
+                clashes.append("%s (ours %r, theirs %r)" % (field, our.get(field), their.get(field)))
+            if value is not _MISSING:
+                data[field] = value
+        if clashes:
+            conflicts.append((key, "%s changed on both sides: %s; kept ours" % (name(key), ", ".join(clashes))))
+        components[key] = data
+
+    # A wire stays unless one side removed it, and is added if either side added it
+    connections = {}
+    for key, data in our_connections.items():
+        if key in their_connections or key not in base_connections:
+            connections[key] = data
+    for key, data in their_connections.items():
+        if key not in our_connections and key not in base_connections:
+            connections[key] = data
+    for key in list(connections):
+        for component, pin_index in key:
+            data = components.get(component)
+            if data is None or pin_index >= data.get("pin_count", pin_index + 1):
+                del connections[key]
+                if key not in base_connections:
+                    conflicts.append((component, "a wire added to %s no longer has a pin to attach to; dropped it"
+                                      % name(component)))
+                break
+
+    blocks = {}
+    base_blocks, our_blocks, their_blocks = base.get("blocks", {}), ours.get("blocks", {}), theirs.get("blocks", {})
+    for name in list(our_blocks) + [name for name in their_blocks if name not in our_blocks]:
+        value, clash = merge_value(base_blocks.get(name, _MISSING), our_blocks.get(name, _MISSING),
+                                   their_blocks.get(name, _MISSING))
+        if clash:
+            conflicts.append((None, "block definition %s changed on both sides; kept ours" % name))
+        if value is not _MISSING:
+            blocks[name] = value
+
+    merged = {
+        "version": max(project.get("version", 1) for project in (base, ours, theirs)),
+        "components": list(components.values()),
+        "connections": list(connections.values()),
+    }
+    if blocks:
+        merged["blocks"] = blocks
+    return merged, conflicts
+
+
+def read_project(filename):
+    with open(filename, "r") as file:
+        project_data = json.load(file)
+    if not (isinstance(project_data, dict) and isinstance(project_data.get("components"), list) and
+            isinstance(project_data.get("connections"), list)):
+        raise ValueError("not an FPGA Builder project")
+    return project_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare and merge FPGA Builder projects")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    diff_parser = commands.add_parser("diff", help="list what changed from OLD to NEW; exits with 1 if anything did")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new")
+    diff_parser.add_argument("--json", action="store_true", help="print the differences as JSON")
+    merge_parser = commands.add_parser("merge", help="merge OURS and THEIRS, both edited from BASE; "
+                                                     "exits with 1 if there were conflicts")
+    merge_parser.add_argument("base")
+    merge_parser.add_argument("ours")
+    merge_parser.add_argument("theirs")
+    merge_parser.add_argument("-o", "--output", help="write the merged project here instead of to standard output")
+    args = parser.parse_args()
+
+    filenames = [args.old, args.new] if args.command == "diff" else [args.base, args.ours, args.theirs]
+    projects = []
+    for filename in filenames:
+        try:
+            projects.append(read_project(filename))
+        except (OSError, ValueError) as error:
+            print("%s: cannot read %s: %s" % (parser.prog, filename, error), file=sys.stderr)
+            return 2
+    for filename, project_data in zip(filenames, projects):
+        for label in duplicate_labels(project_data):
+            print("note: %s has several components labelled %r; wires refer to the last one, the others are "
+                  "matched by their order in the file" % (filename, label), file=sys.stderr)
+
+    if args.command == "diff":
+        diff = ProjectDiff(*projects)
+        if args.json:
+            print(json.dumps(diff.to_json(), indent=2))
+        else:
+            for line in diff.summary():
+                print(line)
+        return 1 if diff else 0
+
+    merged, conflicts = merge_projects(*projects)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(merged, file)
+    else:
+        json.dump(merged, sys.stdout)
+        sys.stdout.write("\n")
+    for _, message in conflicts:
+        print("conflict: %s" % message, file=sys.stderr)
+    return 1 if conflicts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,422 @@
+# Search index for FPGA Builder.
+#
+# An inverted index from lower-case word tokens to the objects whose text
+# contains them. A query token matches index tokens exactly, by prefix, or
+# fuzzily (one typo). Prefix lookups use a sorted token list that is only
+# re-sorted when a query needs it. Fuzzy lookups use a deletion index: every
+# token is also stored under each variant with one character removed, so two
+# tokens one edit apart always share a variant.
+#
+# Results are ranked by score, then by display text. A query is driven by its
+# word with the fewest matches. For each group of keys that word matches, the
+# search estimates the cost of two ways to find the results, from a small
+# sample of the group, and takes the cheaper one. It either collects the group
+# through the postings, narrowing it down and splitting it by score with set
+# operations, or it walks all keys in result order, from a list that is only
+# re-sorted when a query needs it, and stops as soon as nothing further along
+# can rank among the results. Only the best limit collected keys are put in
+# result order.
+
+import bisect
+import heapq
+import itertools
+import re
+from collections import Counter, defaultdict
+from operator import itemgetter
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+TOKEN_END = "{"  # Sorts after every character a token can hold
+COUNTED_PREFIX_TOKENS = 2000  # Prefix matches above which only the tokens are counted, not their keys
+# Rough costs of the steps of a search, relative to scoring a key against a word
+WALK_STEP_COST = 0.15  # Passing over a key in a walk in result order
+TOKEN_COST = 0.35  # Gathering the keys of one index token into a set of candidates
+GATHER_COST = 0.03  # Adding a key found through the postings to a set of candidates
+CHECK_COST = 0.5  # Testing a key's words against the index tokens of a group by set
+INTERSECT_COST = 0.07  # Looking a key up in a set intersection
+RANK_COST = 0.55  # Putting a collected key in result order
+SAMPLE_SIZE = 50  # Keys of a group tried first, to estimate how many of them match the whole query
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def deletions(token):
+    """The token itself plus every variant with one character removed."""
+    return {token} | {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def within_one_edit(a, b):
+    """True if a and b differ by at most one insertion, deletion or substitution."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:]
+
+
+class SearchIndex:
+    def __init__(self):
+        self.keys = {}  # key -> (display text, tokens, rank)
+        self.postings = defaultdict(set)  # token -> keys
+        self.variants = defaultdict(set)  # deletion variant -> tokens
+        self.sorted_tokens = []
+        self.sorted_dirty = False  # sorted_tokens has unsorted additions
+        self.removed_tokens = False  # sorted_tokens may hold tokens no longer in postings
+        # Every key's rank, (display text, sequence number, key), in result order
+        self.ranks = []
+        self.ranks_dirty = False  # ranks has unsorted additions
+        self.removed_ranks = 0  # Entries of ranks whose key was removed or re-added since
+        self.sequence = itertools.count()  # Breaks ties between equal display texts
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def add(self, key, display, *texts):
+        """Index key under the words of texts, replacing any earlier entry for it."""
+        if key in self.keys:
+            self.remove(key)
+        tokens = set()
+        for text in texts:
+            if text:
+                tokens.update(tokenize(text))
+        rank = (display, next(self.sequence), key)
+        self.keys[key] = (display, tokens, rank)
+        self.ranks.append(rank)
+        self.ranks_dirty = True
+        for token in tokens:
+            if token not in self.postings:
+                self.sorted_tokens.append(token)
+                self.sorted_dirty = True
+                for variant in deletions(token):
+                    self.variants[variant].add(token)
+            self.postings[token].add(key)
+
+    def remove(self, key):
+        entry = self.keys.pop(key, None)
+        if entry is None:
+            return
+        self.removed_ranks += 1
+        for token in entry[1]:
+            keys = self.postings[token]
+            keys.discard(key)
+            if not keys:
+                del self.postings[token]
+                self.removed_tokens = True
+                for variant in deletions(token):
+                    tokens = self.variants[variant]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self.variants[variant]
+
+    def clear(self):
+        self.__init__()
+
+    def prepare(self):
+        """Sort what the first query would otherwise have to, for instance after many additions."""
+        self._prefix_range("")
+        self._ranked()
+
+    def display(self, key):
+        return self.keys[key][0]
+
+    def _prefix_range(self, prefix):
+        """Return the slice of sorted_tokens holding the tokens that start with prefix."""
+        if self.removed_tokens:
+            self.sorted_tokens = [token for token in self.sorted_tokens if token in self.postings]
+            self.removed_tokens = False
+        if self.sorted_dirty:
+            # Timsort only has to merge the new tokens into an already sorted run
+            self.sorted_tokens.sort()
+            self.sorted_dirty = False
+        return (bisect.bisect_left(self.sorted_tokens, prefix),
+                bisect.bisect_left(self.sorted_tokens, prefix + TOKEN_END))
+
+    def _ranked(self):
+        """Return the ranks of all keys in result order; entries of removed keys may remain."""
+        if self.removed_ranks > len(self.keys):
+            self.ranks = [rank for rank in self.ranks if self._current(rank)]
+            self.removed_ranks = 0
+        if self.ranks_dirty:
+            # Additions come after every rank already in the list, so sorting
+            # by display text alone keeps equal texts in sequence order
+            self.ranks.sort(key=itemgetter(0))
+            self.ranks_dirty = False
+        return self.ranks
+
+    def _current(self, rank):
+        entry = self.keys.get(rank[2])
+        return entry is not None and entry[2] is rank
+
+    def _fuzzy_tokens(self, token):
+        candidates = set()
+        for variant in deletions(token):
+            candidates.update(self.variants.get(variant, ()))
+        return [candidate for candidate in candidates if within_one_edit(token, candidate)]
+
+    def _groups(self, token):
+        """Return [(score, estimated keys, tokens)] for what a query token matches: 3 exact, 2 prefix, 1 fuzzy.
+
+        The prefix tokens are given as a (start, end) slice of sorted_tokens,
+        and their key count is only estimated when there are many of them.
+        """
+        groups = []
+        if token in self.postings:
+            groups.append((3, len(self.postings[token]), [token]))
+        start, end = self._prefix_range(token)
+        if token in self.postings:
+            start += 1  # The token itself sorts first
+        if end - start > COUNTED_PREFIX_TOKENS:
+            groups.append((2, end - start, (start, end)))
+        elif end > start:
+            groups.append((2, sum(len(self.postings[match]) for match in self.sorted_tokens[start:end]), (start, end)))
+        if len(token) > 2:
+            fuzzy = [match for match in self._fuzzy_tokens(token) if not match.startswith(token)]
+            if fuzzy:
+                groups.append((1, sum(len(self.postings[match]) for match in fuzzy), fuzzy))
+        return groups
+
+    def _score(self, key, token):
+        """Score one key against one query token without going through the index."""
+        tokens = self.keys[key][1]
+        if token in tokens:
+            return 3
+        for indexed in tokens:
+            if indexed.startswith(token):
+                return 2
+        if len(token) > 2:
+            for indexed in tokens:
+                if within_one_edit(token, indexed):
+                    return 1
+        return 0
+
+    def _group_tokens(self, token, group):
+        """Return the index tokens of one of the groups _groups() gives for token."""
+        score, _, matches = group
+        if score == 3:
+            return [token]
+        if score == 2:
+            return self.sorted_tokens[matches[0]:matches[1]]
+        return matches
+
+    def _group_keys(self, token, group):
+        """Return the keys of one of the groups _groups() gives for token; do not modify the set."""
+        if group[0] == 3:
+            return self.postings[token]
+        return set().union(*map(self.postings.__getitem__, self._group_tokens(token, group)))
+
+    def search(self, query, limit=100):
+        """Return up to limit keys matching every word of the query, best matches first.
+
+        Results are ordered by score, then display text, and are the same
+        whichever way the keys were found.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or limit <= 0:
+            return []
+        groups = {token: self._groups(token) for token in tokens}
+        sizes = {token: sum(group[1] for group in groups[token]) for token in tokens}
+        driver = min(tokens, key=sizes.get)
+        if not sizes[driver]:
+            return []
+        others = [token for token in tokens if token != driver]
+        bonus = sum(groups[token][0][0] for token in others)  # Most the other words can add to a key's score
+        # Words that only match exactly narrow the candidates down by set
+        # intersection, smallest first. The others are scored.
+        exact_only = sorted((token for token in others if len(groups[token]) == 1 and groups[token][0][0] == 3),
+                            key=sizes.get)
+        exact_sets = [self.postings[token] for token in exact_only]
+        exact_bonus = 3 * len(exact_only)
+        scored = [token for token in others if token not in exact_only]
+        group_tokens = {}
+
+        def tokens_of(token, group):
+            # The index tokens of a group as a set, built once per query
+            index = (token, group[0])
+            if index not in group_tokens:
+                group_tokens[index] = set(self._group_tokens(token, group))
+            return group_tokens[index]
+
+        ranks = self._ranked()
+        found = []  # (-score, rank) of keys found one by one
+        bulk = []  # (score, keys) found together
+        scores = Counter()  # score -> keys found with it
+        seen = set()
+
+        def add(key, score, walked=None):
+            # The key matches the driver and the exact-only words; score the rest
+            seen.add(key)
+            score += exact_bonus
+            for token in scored:
+                token_score = self._score(key, token)
+                if not token_score:
+                    return
+                score += token_score
+            found.append((-score, self.keys[key][2]))
+            scores[score] += 1
+            if walked is not None:
+                walked[score] += 1
+
+        def settled(bound, walked=None):
+            # Whether limit keys are found that nothing still to come can
+            # beat. Keys still to come in a walk in result order rank below
+            # the ones the walk found with the same score.
+            count = sum(number for score, number in scores.items() if score > bound)
+            return count + (walked[bound] if walked else 0) >= limit
+
+        def passes(key):
+            return all(key in keys for keys in exact_sets)
+
+        def walk_steps(sample, count):
+            # How far a walk in result order goes to come across limit of
+            # count keys, from where a sample of them is in that order. The
+            # keys are taken as spread evenly from a little before the first
+            # sampled one to the last.
+            needed = limit / count
+            if len(sample) < 2 or needed >= 1:
+                return len(ranks)
+            positions = sorted(bisect.bisect_left(ranks, self.keys[key][2]) for key in sample)
+            spacing = (positions[-1] - positions[0]) / (len(positions) - 1)
+            return max(0, positions[0] - spacing) + needed * len(positions) * spacing + 1
+
+        def first_ranks(keys):
+            # The ranks of the first limit collected keys in result order,
+            # picked out of a walk where that looks cheaper than ranking them
+            # all. The walk gives up after what ranking would have cost.
+            budget = len(keys) * RANK_COST / WALK_STEP_COST
+            if walk_steps(list(itertools.islice(keys, SAMPLE_SIZE)), len(keys)) < budget:
+                picked = []
+                for rank in itertools.islice(ranks, int(budget)):
+                    if rank[2] in keys and self._current(rank):
+                        picked.append(rank)
+                        if len(picked) == limit:
+                            return picked
+            return heapq.nsmallest(limit, [self.keys[key][2] for key in keys])
+
+        def gather_cost(token, group):
+            score, size, matches = group
+            count = 1 if score == 3 else matches[1] - matches[0] if score == 2 else len(matches)
+            return count * TOKEN_COST + size * GATHER_COST
+
+        def split(keys, token, prefixed):
+            # Split keys by the best group of token they fall in, dropping
+            # those it does not match, with set operations rather than by
+            # scoring each key. Keys with a word that starts with token, as
+            # given by prefixed, match it at least by prefix.
+            parts = []
+            for group in groups[token]:
+                if group[0] == 3:
+                    hit = keys & self.postings[token]
+                elif prefixed:
+                    hit = keys
+                elif gather_cost(token, group) < len(keys) * CHECK_COST:
+                    hit = keys & self._group_keys(token, group)
+                else:
+                    matches = tokens_of(token, group)
+                    hit = {key for key in keys if not self.keys[key][1].isdisjoint(matches)}
+                if hit:
+                    parts.append((group[0], hit))
+                    keys = keys - hit
+            return parts
+
+        for group in groups[driver]:
+            score, size, _ = group
+            bound = score + bonus
+            if settled(bound):
+                break
+            # How many keys of the group pass the exact-only words and match
+            # the whole query, estimated from a sample spread over its tokens
+            driver_tokens = self._group_tokens(driver, group)
+            per_token = -(-SAMPLE_SIZE // len(driver_tokens))
+            sample = [key for match in driver_tokens[::max(1, len(driver_tokens) // SAMPLE_SIZE)]
+                      for key in itertools.islice(self.postings[match], per_token)]
+            passing = [key for key in sample if passes(key)]
+            matching = [key for key in passing if all(self._score(key, token) for token in scored)]
+            exact_share = max(0.5, len(passing)) / len(sample)
+            share = max(0.5, len(matching)) / len(sample)
+            # A walk passes over the keys in result order until it has found
+            # limit of them
+            steps = walk_steps(matching, size * share)
+            # Collecting the group costs gathering its keys, narrowing them
+            # down by set intersection, splitting them by how well they match
+            # the other words and ranking the rest
+            remaining = size * exact_share
+            collect_cost = (gather_cost(driver, group) if score < 3 else 0) + \
+                size * INTERSECT_COST * (len(exact_only) + 2) + \
+                sum(remaining * INTERSECT_COST + sum(min(gather_cost(token, other), remaining * CHECK_COST)
+                                                     for other in groups[token] if other[0] < 3)
+                    for token in scored) + \
+                min(size * share * RANK_COST, steps * WALK_STEP_COST)
+            # Of scoring, or only ranking, a key of the group the walk comes
+            # across, and of making sure it is in the group by prefix or typo
+            score_cost = max(1, len(scored)) + (0 if score == 3 else 1)
+            step_cost = WALK_STEP_COST + (0 if score == 3 else CHECK_COST)
+            # The walk comes across limit matches, and the keys of the group
+            # that pass the exact-only words but not the rest along with them
+            passed = min(steps, limit * exact_share / share)
+            if steps * step_cost + passed * score_cost < collect_cost:
+                if score == 3:
+                    in_group = self.postings[driver].__contains__
+                else:
+                    matches = tokens_of(driver, group)
+
+                    def in_group(key):
+                        # Keys with a better match to the driver belong to an earlier group
+                        entry = self.keys.get(key)
+                        return entry is not None and not entry[1].isdisjoint(matches) and \
+                            self._score(key, driver) == score
+                # Keys that match another word exactly are few enough to be
+                # found directly, and the walk can then stop against the
+                # lower score the other keys reach with that word
+                walk_bound = bound
+                for token in scored:
+                    top_score, top_size, _ = groups[token][0]
+                    if top_score == 3 and len(groups[token]) > 1 and top_size * score_cost * 2 < collect_cost:
+                        for key in self.postings[token]:
+                            if key not in seen and in_group(key) and passes(key):
+                                add(key, score)
+                        walk_bound -= 3 - groups[token][1][0]
+                # Walk, and give up once that has cost as much as collecting
+                # the group would
+                walked = Counter()
+                spent = 0.0
+                for rank in ranks:
+                    spent += step_cost
+                    if spent > collect_cost:
+                        break
+                    key = rank[2]
+                    if in_group(key) and key not in seen and self._current(rank) and passes(key):
+                        spent += score_cost
+                        add(key, score, walked)
+                        if settled(walk_bound, walked):
+                            break
+                if settled(walk_bound, walked):
+                    continue
+            candidates = self._group_keys(driver, group)
+            for keys in exact_sets:
+                candidates = candidates & keys
+            parts = [(score + exact_bonus, candidates - seen if seen else candidates)]
+            for token in scored:
+                prefixed = score > 1 and driver.startswith(token)
+                parts = [(total + token_score, keys)
+                         for total, keys in parts for token_score, keys in split(keys, token, prefixed)]
+            for total, keys in parts:
+                if not keys:
+                    continue
+                seen.update(keys)
+                scores[total] += len(keys)
+                bulk.append((total, keys))
+        # Only rank the collected keys that can still be among the results
+        for total, keys in bulk:
+            if sum(number for score, number in scores.items() if score > total) < limit:
+                found.extend((-total, rank) for rank in first_ranks(keys))
+        best = heapq.nsmallest(limit, found)
+        return [rank[2] for _, rank in best]
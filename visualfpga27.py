@@ -1,15 +1,48 @@
 # FPGA Builder Build 27, August 19, 2024.
 
+import time
+STARTED = time.perf_counter()  # Start of the startup profile, taken before the heavy imports
+
+import argparse
 import json
+import math
+import os
+from contextlib import contextmanager
 import sys
+import uuid
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QGraphicsScene, QGraphicsView, 
                              QGraphicsItem, QGraphicsLineItem, QGraphicsPathItem, QInputDialog, QGraphicsTextItem, 
                              QGraphicsRectItem, QVBoxLayout, QWidget, QHBoxLayout, QMessageBox, QFileDialog,
-                             QDialog, QFormLayout, QComboBox, QSpinBox, QDialogButtonBox, QLineEdit)
-from PyQt5.QtCore import Qt, QPointF, QRectF
-from PyQt5.QtGui import QPen, QColor, QBrush, QPainter, QPixmap, QPainterPath, QPolygonF, QFont
+                             QDialog, QFormLayout, QComboBox, QSpinBox, QDialogButtonBox, QLineEdit, QShortcut, QStyle,
+                             QListWidget, QLabel, QDockWidget)
+from PyQt5.QtCore import Qt, QPointF, QRectF, QTimer, QMimeData
+from PyQt5.QtGui import QPen, QColor, QBrush, QPainter, QPixmap, QPainterPath, QPolygonF, QFont, QKeySequence, QImage, QTransform
+
+# placement, journal, collab and project_diff are imported where they are
+# first used; the first frame does not need them
+import library
+from profiler import PROFILER, StartupProfile, profiled
+from search_index import SearchIndex
+from wire_index import SegmentIndex
 
 GRID_SIZE = 20
+PASTE_OFFSET = 2 * GRID_SIZE  # Distance between a pasted copy and the original
+CLIPBOARD_MIME_TYPE = "application/x-fpga-builder-selection"
+LIBRARY = library.ComponentLibrary(os.path.join(os.path.dirname(os.path.abspath(__file__)), "library"))
+PROJECT_VERSION = 3  # Version of the .fga file format written by save_project
+AUTOSAVE_DIR = os.path.join(os.path.expanduser("~"), ".fpga_builder")
+JOURNAL_COMPACT_INTERVAL = 60000  # Milliseconds between autosave snapshots
+JOURNAL_COMPACT_THRESHOLD = 1000  # Journal entries that force an early snapshot
+FIND_RESULT_LIMIT = 200  # Matches listed in the find panel
+MINIMAP_TILE = 32  # Pixels per side of the minimap tiles that are redrawn after edits
+MINIMAP_REFRESH_BUDGET = 0.008  # Seconds of tile redrawing per event loop turn
+JUNCTION_RADIUS = 3  # Size of the dots drawn where wires of one net meet
+NET_MARKER_MIN_SCALE = 0.5  # Zoom level below which junctions and overlaps are not drawn
+HOVER_TOLERANCE = 4  # Pixels between the cursor and a wire that still count as pointing at it
+GRID_MIN_SPACING = 4  # Pixels between grid lines below which the grid is not drawn
+FIRST_FRAME_TARGET = 0.5  # Seconds from program start to the first painted frame
+COLLAB_POLL_INTERVAL = 30  # Milliseconds between checks for edits from collaborators
+COMPARISON_DELAY = 300  # Milliseconds after the last edit before a comparison is brought up to date
 
 class ComponentDialog(QDialog):
     def __init__(self, parent=None):
@@ -22,7 +55,7 @@ class ComponentDialog(QDialog):
         layout.addRow("Component Label:", self.label_edit)
         
         self.component_type = QComboBox()
-        self.component_type.addItems(["IC Chip", "Capacitor", "Resistor", "Crystal Oscillator", "Inductor", "Diode", "DIP Switch"])
+        self.component_type.addItems(["IC Chip", "Capacitor", "Resistor", "Crystal Oscillator", "Inductor", "Diode", "DIP Switch", "Port"])
         layout.addRow("Component Type:", self.component_type)
         
         self.chip_type = QComboBox()
@@ -69,6 +102,13 @@ class ComponentDialog(QDialog):
             self.pin_count.setEnabled(True)
             self.pin_orientation.setCurrentText("top-bottom")
             self.pin_orientation.setEnabled(False)
+        elif component_type == "Port":
+            # A port is a single pin that becomes a pin of the block when the
+            # design is placed as a block
+            self.chip_type.setEnabled(False)
+            self.pin_count.setEnabled(False)
+            self.pin_orientation.setCurrentText("left-right")
+            self.pin_orientation.setEnabled(False)
 
     def get_data(self):
         return {
@@ -79,6 +119,198 @@ class ComponentDialog(QDialog):
             "pin_orientation": self.pin_orientation.currentText()
         }
 
+class FPGAScene(QGraphicsScene):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pending_connections = None  # Connections to reroute when the current batch ends
+        # Components and wires by label, type and net name, kept up to date by the items themselves
+        self.search_index = SearchIndex()
+        self.change_listeners = []  # Called with the scene rect of every component or wire that changes
+        # Wire segments by row and column, kept up to date by the wires themselves
+        self.wire_index = SegmentIndex()
+        self.net_numbers = {}  # wire -> number shared by its net, filled in as nets are looked at
+        self.grid_rect = QRectF()  # Area covered by the background grid
+        self.components_by_id = {}  # Kept up to date by the components themselves
+
+    def content_rect(self):
+        """Return the area holding the grid and every item, as shown by exports and the minimap."""
+        return self.sceneRect().united(self.grid_rect)
+
+    def drawBackground(self, painter, rect):
+        super().drawBackground(painter, rect)
+        # The grid is painted rather than made of line items, so it costs
+        # nothing to create and only the visible part is drawn
+        area = rect.intersected(self.grid_rect)
+        if area.isEmpty() or GRID_SIZE * painter.worldTransform().m11() < GRID_MIN_SPACING:
+            return
+        grid = self.grid_rect
+        painter.setPen(QPen(Qt.lightGray))
+        x = grid.left() + math.ceil((area.left() - grid.left()) / GRID_SIZE) * GRID_SIZE
+        while x <= area.right() and x < grid.right():
+            painter.drawLine(QPointF(x, area.top()), QPointF(x, area.bottom()))
+            x += GRID_SIZE
+        y = grid.top() + math.ceil((area.top() - grid.top()) / GRID_SIZE) * GRID_SIZE
+        while y <= area.bottom() and y < grid.bottom():
+            painter.drawLine(QPointF(area.left(), y), QPointF(area.right(), y))
+            y += GRID_SIZE
+
+    def net_number(self, wire):
+        number = self.net_numbers.get(wire)
+        if number is None:
+            net = net_connections(wire)
+            number = id(wire)
+            for member in net:
+                self.net_numbers[member] = number
+        return number
+
+    def same_net(self, wire, other):
+        return self.net_number(wire) == self.net_number(other)
+
+    def nets_changed(self):
+        """Forget the known nets after a wire was added or removed and redraw the junctions."""
+        if self.net_numbers:
+            self.net_numbers = {}
+            self.invalidate(self.sceneRect(), QGraphicsScene.ForegroundLayer)
+
+    def item_changed(self, item):
+        """Tell the change listeners that the area covered by item needs redrawing."""
+        if self.change_listeners:
+            rect = item.sceneBoundingRect()
+            for listener in self.change_listeners:
+                listener(rect)
+
+    def index_items(self, items):
+        for item in items:
+            self.search_index.add(item, *item.search_text())
+
+    def clear(self):
+        # Items removed by clear() are not told about it, so drop them from the index here
+        self.search_index.clear()
+        self.wire_index.clear()
+        self.net_numbers = {}
+        self.components_by_id = {}
+        rect = self.sceneRect()
+        super().clear()
+        for listener in self.change_listeners:
+            listener(rect)
+
+    @contextmanager
+    def batch(self):
+        """Collect wire reroutes while many components change and run each one once at the end."""
+        if self.pending_connections is not None:
+            yield  # Already inside a batch
+            return
+        self.pending_connections = set()
+        try:
+            yield
+        finally:
+            pending, self.pending_connections = self.pending_connections, None
+            for connection in pending:
+                if connection.scene() is self:
+                    connection.updatePosition()
+
+class LibraryDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Add Library Part")
+
+        layout = QVBoxLayout(self)
+
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("Filter parts")
+        self.filter_edit.textChanged.connect(self.update_filter)
+        layout.addWidget(self.filter_edit)
+
+        # Listing only needs the file names; part files are read when selected
+        self.part_list = QListWidget()
+        self.part_list.addItems(LIBRARY.names())
+        self.part_list.currentTextChanged.connect(self.update_description)
+        self.part_list.itemDoubleClicked.connect(self.accept)
+        layout.addWidget(self.part_list)
+
+        self.description = QLabel()
+        self.description.setWordWrap(True)
+        layout.addWidget(self.description)
+
+        form = QFormLayout()
+        self.label_edit = QLineEdit()
+        form.addRow("Component Label:", self.label_edit)
+        layout.addLayout(form)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+
+        self.part_list.setCurrentRow(0)
+
+    def update_filter(self, text):
+        text = text.lower()
+        for row in range(self.part_list.count()):
+            item = self.part_list.item(row)
+            item.setHidden(text not in item.text().lower())
+
+    def update_description(self, name):
+        if not name:
+            self.description.clear()
+            return
+        try:
+            part = LIBRARY.get(name)
+        except (KeyError, ValueError) as error:
+            self.description.setText("Cannot read part: %s" % error)
+            return
+        self.description.setText("%s\n%s, %d pins, %s" % (part.description, part.package, len(part.pins), part.category))
+
+    def get_data(self):
+        item = self.part_list.currentItem()
+        return {
+            "part": item.text() if item else None,
+            "label": self.label_edit.text()
+        }
+
+class ArrayDialog(QDialog):
+    def __init__(self, pitch_x, pitch_y, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Array Replicate")
+
+        layout = QFormLayout(self)
+
+        self.rows = QSpinBox()
+        self.rows.setRange(1, 256)
+        self.rows.setValue(2)
+        layout.addRow("Rows:", self.rows)
+
+        self.columns = QSpinBox()
+        self.columns.setRange(1, 256)
+        self.columns.setValue(2)
+        layout.addRow("Columns:", self.columns)
+
+        self.pitch_x = QSpinBox()
+        self.pitch_x.setRange(GRID_SIZE, 100 * GRID_SIZE)
+        self.pitch_x.setSingleStep(GRID_SIZE)
+        self.pitch_x.setValue(pitch_x)
+        layout.addRow("Column Pitch:", self.pitch_x)
+
+        self.pitch_y = QSpinBox()
+        self.pitch_y.setRange(GRID_SIZE, 100 * GRID_SIZE)
+        self.pitch_y.setSingleStep(GRID_SIZE)
+        self.pitch_y.setValue(pitch_y)
+        layout.addRow("Row Pitch:", self.pitch_y)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+        layout.addRow(button_box)
+
+    def get_data(self):
+        # Pitches are kept on the grid so every copy snaps the same way
+        return {
+            "rows": self.rows.value(),
+            "columns": self.columns.value(),
+            "pitch_x": round(self.pitch_x.value() / GRID_SIZE) * GRID_SIZE,
+            "pitch_y": round(self.pitch_y.value() / GRID_SIZE) * GRID_SIZE
+        }
+
 class Pin(QGraphicsRectItem):
     def __init__(self, parent, x, y):
         super().__init__(parent)
@@ -87,13 +319,22 @@ class Pin(QGraphicsRectItem):
         self.setFlag(QGraphicsItem.ItemIsSelectable)
         self.setZValue(1)  # Set the Z-value to be above components and connections
         self.parent_component = parent
+        self.index = len(parent.pins)  # Position in parent.pins, used in project files
+        self.name = str(self.index + 1)
+
+    def net_name(self):
+        component = self.parent_component
+        return "%s.%s" % (component.label or component.component_type, self.name)
 
     def scenePos(self):
-        return self.parent_component.scenePos() + self.pos()
+        # Wires attach to the centre of the pin, wherever the component is turned
+        return self.mapToScene(self.rect().center())
 
 class FPGAComponent(QGraphicsItem):
-    def __init__(self, x, y, width, height, label="", pin_count=8, pin_orientation='left-right', component_type="IC Chip"):
+    def __init__(self, x, y, width, height, label="", pin_count=8, pin_orientation='left-right', component_type="IC Chip", component_id=None, chip_type="Regular"):
         super().__init__()
+        # Stable identifier used in project files; labels are not unique
+        self.component_id = component_id or uuid.uuid4().hex
         self.setPos(x, y)
         self.width = width
         self.height = height
@@ -101,16 +342,57 @@ class FPGAComponent(QGraphicsItem):
         self.pin_count = pin_count
         self.pin_orientation = pin_orientation
         self.component_type = component_type
+        self.chip_type = chip_type
         self.setFlag(QGraphicsItem.ItemIsMovable)
+        self.setFlag(QGraphicsItem.ItemIsSelectable)
         self.setFlag(QGraphicsItem.ItemSendsGeometryChanges)
         self.setZValue(1)  # Set the Z-value to be above connections
         self.rotation_angle = 0
         self.pins = []
+        self.connections = set()  # Attached wires, maintained by Connection.itemChange
         self.create_pins()
 
+    def to_dict(self):
+        return {
+            "id": self.component_id,
+            "label": self.label,
+            "component_type": self.component_type,
+            "chip_type": self.chip_type,
+            "width": self.width,
+            "height": self.height,
+            "pin_count": self.pin_count,
+            "pin_orientation": self.pin_orientation,
+            "rotation": self.rotation_angle,
+            "x": self.pos().x(),
+            "y": self.pos().y()
+        }
+
+    @classmethod
+    def from_dict(cls, data, definitions=None):
+        if "part" in data:
+            component = LibraryPart(data["x"], data["y"], LIBRARY.get(data["part"]), data["label"], data.get("id"))
+            component.set_rotation(data.get("rotation", 0))
+            return component
+        if "block" in data:
+            component = BlockInstance(data["x"], data["y"], definitions[data["block"]], data["label"], data.get("id"))
+            component.set_rotation(data.get("rotation", 0))
+            return component
+        # Version 1 files only stored label, pins and position; the loader
+        # used to rebuild every part as a regular 100x50 chip
+        component = cls(data["x"], data["y"], data.get("width", 100), data.get("height", 50), data["label"],
+                        data["pin_count"], data["pin_orientation"], data.get("component_type", "IC Chip"),
+                        data.get("id"), data.get("chip_type", "Regular"))
+        component.set_rotation(data.get("rotation", 0))
+        return component
+
+    def search_text(self):
+        """Return the text shown in search results followed by the texts the component is found by."""
+        return "%s (%s)" % (self.label, self.component_type), self.label, self.component_type
+
     def boundingRect(self):
         return QRectF(0, 0, self.width, self.height)
 
+    @profiled("FPGAComponent.paint")
     def paint(self, painter, option, widget):
         painter.setPen(QPen(Qt.black, 1))
         #painter.setBrush(QBrush(Qt.lightGray))
@@ -166,6 +448,15 @@ class FPGAComponent(QGraphicsItem):
             switch_width = self.width / self.pin_count
             for i in range(self.pin_count // 2):
                 painter.drawRect(int(i * switch_width * 2), 0, int(switch_width), int(self.height))
+        elif self.component_type == "Port":
+            painter.setBrush(QBrush(QColor(255, 255, 204)))  # Light yellow
+            painter.drawPolygon(QPolygonF([
+                QPointF(0, 0),
+                QPointF(self.width * 0.75, 0),
+                QPointF(self.width, self.height / 2),
+                QPointF(self.width * 0.75, self.height),
+                QPointF(0, self.height)
+            ]))
         else:  # IC Chip
             painter.setBrush(QBrush(Qt.lightGray))
             painter.drawRect(0, 0, self.width, self.height)
@@ -174,111 +465,329 @@ class FPGAComponent(QGraphicsItem):
         painter.setFont(QFont("Arial", 8))
         
         painter.drawText(QRectF(0, 0, self.width, self.height), Qt.AlignCenter, self.label)
+        self.paint_selection(painter)
 
+    def paint_selection(self, painter):
+        if self.isSelected():
+            painter.setPen(QPen(QColor(0, 120, 215), 1, Qt.DashLine))
+            painter.setBrush(Qt.NoBrush)
+            painter.drawRect(QRectF(-2, -2, self.width + 4, self.height + 4))
 
-    def create_pins(self):
-        # pins_per_side = max(1, self.pin_count // 4)  # Ensure at least 1 pin per side
-        pins_per_side = self.pin_count // 2  # Divide total pins by 2 for each side
 
-        if self.pin_orientation == 'left-right':
-            pin_spacing = self.height / (self.pin_count // 2 + 1)
-            for i in range(self.pin_count // 2):
-                pin = Pin(self, 0, (i + 1) * pin_spacing)
-                self.pins.append(pin)
-                pin = Pin(self, self.width, (i + 1) * pin_spacing)
-                self.pins.append(pin)
-        elif self.pin_orientation == 'top-bottom':
-            pin_spacing = self.width / (self.pin_count // 2 + 1)
-            for i in range(self.pin_count // 2):
-                pin = Pin(self, (i + 1) * pin_spacing, 0)
-                self.pins.append(pin)
-                pin = Pin(self, (i + 1) * pin_spacing, self.height)
-                self.pins.append(pin)
-        else:  # all-sides
-            pins_per_side = max(1, self.pin_count // 4)  # Divide total pins by 4 for each side
-            extra_pins = self.pin_count % 4
-        
-            # Top side
-            h_spacing = self.width / (pins_per_side + 1)
-            for i in range(pins_per_side + extra_pins):
-                pin = Pin(self, (i + 1) * h_spacing, 0)
-                self.pins.append(pin)
-    
-            # Bottom side
-            for i in range(pins_per_side):
-                pin = Pin(self, (i + 1) * h_spacing, self.height)
-                self.pins.append(pin)
-    
-            # Left side
-            v_spacing = self.height / (pins_per_side + 1)
-            for i in range(pins_per_side):
-                pin = Pin(self, 0, (i + 1) * v_spacing)
-                self.pins.append(pin)
-    
-            # Right side
-            for i in range(pins_per_side):
-                pin = Pin(self, self.width, (i + 1) * v_spacing)
-                self.pins.append(pin)
-        
+    def create_pins(self):
+        # The layout is computed once per shape and shared by all components with that shape
+        for x, y in library.pin_layout(self.component_type, self.width, self.height, self.pin_count, self.pin_orientation):
+            self.pins.append(Pin(self, x, y))
 
     def itemChange(self, change, value):
+        scene = self.scene() if isinstance(self.scene(), FPGAScene) else None
         if change == QGraphicsItem.ItemPositionChange:
+            if scene is not None:
+                scene.item_changed(self)  # The area the component is leaving
             new_pos = value
             new_pos.setX(round(new_pos.x() / GRID_SIZE) * GRID_SIZE)
             new_pos.setY(round(new_pos.y() / GRID_SIZE) * GRID_SIZE)
-            self.update_connections()
             return new_pos
+        if change == QGraphicsItem.ItemPositionHasChanged:
+            if scene is not None:
+                scene.item_changed(self)
+            self.update_connections()
+        elif change in (QGraphicsItem.ItemRotationChange, QGraphicsItem.ItemRotationHasChanged):
+            if scene is not None:
+                scene.item_changed(self)
+        elif change == QGraphicsItem.ItemSceneChange:
+            if scene is not None:
+                scene.components_by_id.pop(self.component_id, None)
+                scene.search_index.remove(self)
+                scene.item_changed(self)
+        elif change == QGraphicsItem.ItemSceneHasChanged:
+            if isinstance(value, FPGAScene):
+                value.components_by_id[self.component_id] = self
+                value.index_items([self])
+                value.item_changed(self)
         return super().itemChange(change, value)
 
     def setLabel(self, label):
         self.label = label
-        self.text_item.setPlainText(self.label)
+        self.update()
+        # Net names of the attached wires start with the label as well
+        if isinstance(self.scene(), FPGAScene):
+            self.scene().index_items([self, *self.connections])
 
     def rotate_component(self):
-        self.rotation_angle += 90
-        if self.rotation_angle >= 360:
-            self.rotation_angle = 0
+        self.set_rotation(self.rotation_angle + 90)
+
+    def set_rotation(self, angle):
+        self.rotation_angle = angle % 360
         self.setRotation(self.rotation_angle)
         self.update_connections()
 
+    @profiled("FPGAComponent.update_connections")
     def update_connections(self):
-        for item in self.scene().items():
-            if isinstance(item, Connection):
-                item.updatePosition()
+        scene = self.scene()
+        if scene is None:
+            return
+        if PROFILER.enabled:
+            PROFILER.count("items_visited", len(self.connections))
+        pending = getattr(scene, "pending_connections", None)
+        if pending is not None:
+            pending.update(self.connections)
+            return
+        for connection in self.connections:
+            connection.updatePosition()
                 
+class BlockInstance(FPGAComponent):
+    """A placed copy of a block definition.
+
+    The instance only has the block's ports as pins. The contents of the block
+    live in the shared BlockDefinition and are not built for each instance.
+    """
+    def __init__(self, x, y, definition, label="", component_id=None):
+        self.definition = definition
+        ports = definition.ports
+        self.left_ports = ports[:(len(ports) + 1) // 2]
+        self.right_ports = ports[len(self.left_ports):]
+        height = (max(len(self.left_ports), 1) + 1) * GRID_SIZE
+        super().__init__(x, y, 100, height, label, len(ports), 'left-right', "Block", component_id)
+
+    def to_dict(self):
+        data = super().to_dict()
+        data["block"] = self.definition.name
+        return data
+
+    def search_text(self):
+        return "%s (%s)" % (self.label, self.definition.name), self.label, self.definition.name, self.component_type
+
+    @profiled("FPGAComponent.paint")
+    def paint(self, painter, option, widget):
+        painter.setPen(QPen(Qt.black, 1))
+        painter.setBrush(QBrush(QColor(204, 229, 204)))  # Light green
+        painter.drawRect(0, 0, self.width, self.height)
+        painter.drawRect(3, 3, self.width - 6, self.height - 6)
+
+        painter.setFont(QFont("Arial", 6))
+        for pin, name in zip(self.pins, self.left_ports + self.right_ports):
+            center = pin.rect().center()
+            if center.x() == 0:
+                painter.drawText(QRectF(6, center.y() - 6, self.width / 2 - 6, 12), Qt.AlignLeft | Qt.AlignVCenter, name)
+            else:
+                painter.drawText(QRectF(self.width / 2, center.y() - 6, self.width / 2 - 6, 12), Qt.AlignRight | Qt.AlignVCenter, name)
+
+        painter.setFont(QFont("Arial", 8))
+        painter.drawText(QRectF(0, 0, self.width, self.height), Qt.AlignCenter, "%s\n[%s]" % (self.label, self.definition.name))
+        self.paint_selection(painter)
+
+    def create_pins(self):
+        spacing = GRID_SIZE
+        for i in range(len(self.left_ports)):
+            self.pins.append(Pin(self, 0, (i + 1) * spacing))
+        for i in range(len(self.right_ports)):
+            self.pins.append(Pin(self, self.width, (i + 1) * spacing))
+        for pin, name in zip(self.pins, self.left_ports + self.right_ports):
+            pin.name = name
+
+class LibraryPart(FPGAComponent):
+    """A component built from a library part definition, with named pins."""
+    def __init__(self, x, y, part, label="", component_id=None):
+        self.part = part
+        super().__init__(x, y, part.width, part.height, label, len(part.pins), 'custom', "Library Part", component_id)
+
+    def to_dict(self):
+        data = super().to_dict()
+        data["part"] = self.part.name
+        return data
+
+    def search_text(self):
+        return "%s (%s)" % (self.label, self.part.name), self.label, self.part.name
+
+    @profiled("FPGAComponent.paint")
+    def paint(self, painter, option, widget):
+        painter.setPen(QPen(Qt.black, 1))
+        painter.setBrush(QBrush(QColor(64, 64, 64)))
+        painter.drawRect(0, 0, self.width, self.height)
+        # Pin 1 marker
+        painter.setBrush(QBrush(Qt.white))
+        painter.drawEllipse(QRectF(6, 6, 6, 6))
+
+        painter.setPen(QPen(Qt.white))
+        painter.setFont(QFont("Arial", 8))
+        painter.drawText(QRectF(0, 0, self.width, self.height), Qt.AlignCenter, "%s\n%s" % (self.label, self.part.name))
+        self.paint_selection(painter)
+
+    def create_pins(self):
+        for number, name, x, y in self.part.pins:
+            pin = Pin(self, x, y)
+            pin.name = name
+            pin.setToolTip(number if name == number else "%s %s" % (number, name))
+            self.pins.append(pin)
+
+class BlockDefinition:
+    """A sub-design that is defined once and placed as any number of BlockInstance items.
+
+    The definition keeps the project data of the sub-design and only builds
+    graphics items from it when the block is opened.
+    """
+    def __init__(self, name, project_data, definitions):
+        self.name = name
+        self.project_data = project_data
+        self.definitions = definitions  # Registry used to resolve nested blocks
+        port_components = [component for component in project_data["components"] if component.get("component_type") == "Port"]
+        self.ports = [component["label"] or "P%d" % (index + 1) for index, component in enumerate(port_components)]
+        self.scene = None
+
+    def expand(self):
+        """Return a scene with the contents of the block, building it on first use."""
+        if self.scene is None:
+            # Keep nothing of a build that fails, so the next call tries again
+            scene = FPGAScene()
+            populate_scene(scene, self.project_data, self.definitions)
+            scene.setSceneRect(scene.itemsBoundingRect().adjusted(-GRID_SIZE, -GRID_SIZE, GRID_SIZE, GRID_SIZE))
+            self.scene = scene
+        return self.scene
+
+def register_block_definitions(definitions, blocks):
+    """Add the block definitions of a project file to a registry.
+
+    Nested definitions are moved up into the same registry. A definition
+    whose name is registered with the same contents shares the registered
+    one. If the contents differ, it is registered under a new name such as
+    adder_2, and the blocks that use it are changed to match. Returns
+    {name in blocks: name registered under}; rename_blocks() applies it to
+    the components that use the blocks.
+    """
+    renames = {}
+    pending = dict(blocks)
+
+    def register(name):
+        project_data = pending.pop(name)
+        renames.update(register_block_definitions(definitions, project_data.pop("blocks", {})))
+        for component in project_data["components"]:
+            if component.get("block") in pending:
+                register(component["block"])  # Blocks used by this one first, they may be renamed
+        rename_blocks(project_data["components"], renames)
+        registered, copy = name, 1
+        while registered in definitions and definitions[registered].project_data != project_data:
+            copy += 1
+            registered = "%s_%d" % (name, copy)
+        if registered not in definitions:
+            definitions[registered] = BlockDefinition(registered, project_data, definitions)
+        renames[name] = registered
+
+    while pending:
+        register(next(iter(pending)))
+    return renames
+
+def rename_blocks(components_data, renames):
+    """Point the block instances among components_data at the names register_block_definitions() used."""
+    for component in components_data:
+        if "block" in component:
+            component["block"] = renames.get(component["block"], component["block"])
+
+def check_version(project_data):
+    """Raise ValueError for project data in a file format newer than PROJECT_VERSION."""
+    version = project_data.get("version", 1)
+    if version > PROJECT_VERSION:
+        raise ValueError("file format version %s is newer than this program supports (%s)" % (version, PROJECT_VERSION))
+
+def populate_scene(scene, project_data, definitions):
+    """Add the components and connections of project data to a scene."""
+    components = {}
+    for component_data in project_data["components"]:
+        component = FPGAComponent.from_dict(component_data, definitions)
+        scene.addItem(component)
+        components[component.component_id] = component
+        # Older project files refer to components by label; as in earlier
+        # releases, a label used twice means the last component with it
+        components[("label", component.label)] = component
+    for connection_data in project_data["connections"]:
+        if "source_id" in connection_data:
+            source_component = components[connection_data["source_id"]]
+            target_component = components[connection_data["target_id"]]
+        else:
+            source_component = components[("label", connection_data["source_label"])]
+            target_component = components[("label", connection_data["target_label"])]
+        source_pin = source_component.pins[connection_data["source_pin_index"]]
+        target_pin = target_component.pins[connection_data["target_pin_index"]]
+        connection = Connection(source_pin, target_pin)
+        scene.addItem(connection)
+        connection.setZValue(-1)  # Ensure connections are below components
+    return components
+
 class Connection(QGraphicsPathItem):
     def __init__(self, source, target):
         super().__init__()
         self.source = source
         self.target = target
-        self.setPen(QPen(QColor(0, 0, 0), 2))
+        self.highlighted = False  # Part of the net under the cursor in net highlight mode
+        self.segments = []  # Horizontal and vertical pieces of the path, from source to target
+        self.update_pen()
+        self.setFlag(QGraphicsItem.ItemIsSelectable)
         self.setZValue(-1)  # Set the Z-value to be below components
         self.updatePosition()
 
+    def itemChange(self, change, value):
+        if change == QGraphicsItem.ItemSceneChange:
+            if isinstance(self.scene(), FPGAScene):
+                self.scene().search_index.remove(self)
+                self.scene().wire_index.remove(self)
+                self.scene().nets_changed()
+                self.scene().item_changed(self)
+        elif change == QGraphicsItem.ItemSceneHasChanged:
+            # Keep the components' wire lists in step with the scene
+            for component in (self.source.parent_component, self.target.parent_component):
+                if value is not None:
+                    component.connections.add(self)
+                else:
+                    component.connections.discard(self)
+            if isinstance(value, FPGAScene):
+                value.index_items([self])
+                value.wire_index.set_segments(self, self.segments)
+                value.nets_changed()
+                value.item_changed(self)
+        elif change == QGraphicsItem.ItemSelectedHasChanged:
+            self.update_pen()
+        return super().itemChange(change, value)
+
+    def update_pen(self):
+        if self.isSelected():
+            self.setPen(QPen(QColor(0, 120, 215), 2))
+        elif self.highlighted:
+            self.setPen(QPen(QColor(255, 140, 0), 3))
+        else:
+            self.setPen(QPen(QColor(0, 0, 0), 2))
+
+    def set_highlighted(self, highlighted):
+        self.highlighted = highlighted
+        self.update_pen()
+
+    def boundingRect(self):
+        # Leave room for the junction dots drawn on top of the wire
+        return super().boundingRect().adjusted(-JUNCTION_RADIUS, -JUNCTION_RADIUS, JUNCTION_RADIUS, JUNCTION_RADIUS)
+
+    def paint(self, painter, option, widget=None):
+        # Selection is shown by the pen colour instead of Qt's dashed bounding box
+        option.state &= ~QStyle.State_Selected
+        super().paint(painter, option, widget)
+
+    @profiled("Connection.updatePosition")
     def updatePosition(self):
+        scene = self.scene()
+        if isinstance(scene, FPGAScene):
+            scene.item_changed(self)  # The area of the old path
         source_pos = self.source.scenePos()
         target_pos = self.target.scenePos()
         x1, y1 = source_pos.x(), source_pos.y()
         x2, y2 = target_pos.x(), target_pos.y()
-        if x1 == x2:
-            path = QPainterPath()
-            path.moveTo(x1, min(y1, y2))
-            path.lineTo(x2, max(y1, y2))
-            self.setPath(path)
-        elif y1 == y2:
-            path = QPainterPath()
-            path.moveTo(min(x1, x2), y1)
-            path.lineTo(max(x1, x2), y2)
-            self.setPath(path)
+        if x1 == x2 or y1 == y2:
+            self.segments = [(x1, y1, x2, y2)]
+        elif x1 < x2:
+            self.segments = [(x1, y1, x1, y2), (x1, y2, x2, y2)]
         else:
-            lines = []
-            if x1 < x2:
-                lines.append((x1, y1, x1, y2))
-                lines.append((x1, y2, x2, y2))
-            else:
-                lines.append((x1, y1, x2, y1))
-                lines.append((x2, y1, x2, y2))
-            self.setPath(self.create_path(lines))
+            self.segments = [(x1, y1, x2, y1), (x2, y1, x2, y2)]
+        self.setPath(self.create_path(self.segments))
+        if isinstance(scene, FPGAScene):
+            scene.wire_index.set_segments(self, self.segments)
+            scene.item_changed(self)
 
     def create_path(self, lines):
         path = QPainterPath()
@@ -288,15 +797,54 @@ class Connection(QGraphicsPathItem):
             path.lineTo(line[2], line[3])
         return path
 
+    def search_text(self):
+        name = "%s - %s" % (self.source.net_name(), self.target.net_name())
+        return name, name
+
+    def to_dict(self):
+        return {
+            "source_id": self.source.parent_component.component_id,
+            "source_pin_index": self.source.index,
+            "target_id": self.target.parent_component.component_id,
+            "target_pin_index": self.target.index
+        }
+
+def net_connections(connection):
+    """Return every wire joined to connection through shared pins, connection included."""
+    net = {connection}
+    pins = {connection.source, connection.target}
+    pending = list(pins)
+    while pending:
+        pin = pending.pop()
+        for other in pin.parent_component.connections:
+            if other not in net and (other.source is pin or other.target is pin):
+                net.add(other)
+                for end in (other.source, other.target):
+                    if end not in pins:
+                        pins.add(end)
+                        pending.append(end)
+    return net
+
 class GraphicsView(QGraphicsView):
     def __init__(self, scene, main_window):
         super().__init__(scene)
         self.main_window = main_window
-        self.setDragMode(QGraphicsView.ScrollHandDrag)
+        self.setDragMode(QGraphicsView.RubberBandDrag)
         self.connection_start = None
         self.temp_connection = None
+        self.drag_start = None  # [(component, position)] while components may be dragged
+        self.pan_start = None  # Last mouse position while panning with the middle button
+        self.first_frame_callback = None  # Called once after the first paint, to time startup
+        self.item_counts = None  # Cached scene item counts for the profiler overlay
+        self.item_counts_time = 0
 
+    @profiled("GraphicsView.mousePressEvent")
     def mousePressEvent(self, event):
+        if event.button() == Qt.MiddleButton:
+            self.pan_start = event.pos()
+            self.viewport().setCursor(Qt.ClosedHandCursor)
+            event.accept()
+            return
         if self.main_window.connecting:
             item = self.itemAt(event.pos())
             if isinstance(item, Pin):
@@ -308,8 +856,7 @@ class GraphicsView(QGraphicsView):
                         connection = Connection(self.connection_start, item)
                         self.scene().addItem(connection)
                         connection.setZValue(-1)  # Ensure the connection is above the grid but below components
-                        self.main_window.undo_stack.append({"action": "add_connection", "item": connection})
-                        self.main_window.redo_stack = []
+                        self.main_window.push_undo({"action": "add_connection", "item": connection})
                         self.connection_start.setBrush(QBrush(Qt.black))
                         self.connection_start = None
                         self.main_window.toggle_connection_mode()
@@ -323,7 +870,16 @@ class GraphicsView(QGraphicsView):
         elif self.main_window.rotating:
             item = self.itemAt(event.pos())
             if isinstance(item, FPGAComponent):
-                item.rotate_component()
+                # Clicking one of several selected components rotates the whole selection
+                self.main_window.rotate_components(self.main_window.selected_components() if item.isSelected() else [item])
+        elif event.button() == Qt.LeftButton:
+            item = self.itemAt(event.pos())
+            if isinstance(item, Pin):
+                item = item.parent_component
+            if isinstance(item, FPGAComponent):
+                # Qt drags every selected component when one of them is grabbed
+                group = self.main_window.selected_components() if item.isSelected() else [item]
+                self.drag_start = [(component, component.pos()) for component in group]
         elif event.button() == Qt.RightButton:
             item = self.itemAt(event.pos())
             if isinstance(item, FPGAComponent):
@@ -332,7 +888,26 @@ class GraphicsView(QGraphicsView):
                 self.delete_connection(item)
         super().mousePressEvent(event)
 
+    def mouseDoubleClickEvent(self, event):
+        item = self.itemAt(event.pos())
+        if isinstance(item, Pin):
+            item = item.parent_component
+        if isinstance(item, BlockInstance):
+            self.main_window.open_block(item.definition)
+            return
+        super().mouseDoubleClickEvent(event)
+
+    @profiled("GraphicsView.mouseMoveEvent")
     def mouseMoveEvent(self, event):
+        if self.pan_start is not None:
+            delta = event.pos() - self.pan_start
+            self.pan_start = event.pos()
+            self.horizontalScrollBar().setValue(self.horizontalScrollBar().value() - delta.x())
+            self.verticalScrollBar().setValue(self.verticalScrollBar().value() - delta.y())
+            event.accept()
+            return
+        if PROFILER.enabled:
+            PROFILER.take("items_visited")
         if self.main_window.connecting and self.connection_start:
             end_item = self.itemAt(event.pos())
             if isinstance(end_item, Pin) and end_item.parent_component != self.connection_start.parent_component:
@@ -353,22 +928,161 @@ class GraphicsView(QGraphicsView):
             self.temp_connection.setZValue(-1)  # Ensure the temporary connection is below components
             self.scene().addItem(self.temp_connection)
         
-        super().mouseMoveEvent(event)
+        if self.main_window.net_highlight and event.buttons() == Qt.NoButton:
+            self.main_window.highlight_net_at(self.mapToScene(event.pos()), HOVER_TOLERANCE / self.transform().m11())
+
+        # Moving a group reroutes each affected wire once, not once per component
+        with self.scene().batch():
+            super().mouseMoveEvent(event)
+        if PROFILER.enabled:
+            PROFILER.stat("items_visited_per_move", PROFILER.take("items_visited"))
 
+    @profiled("GraphicsView.mouseReleaseEvent")
     def mouseReleaseEvent(self, event):
+        if event.button() == Qt.MiddleButton and self.pan_start is not None:
+            self.pan_start = None
+            self.viewport().unsetCursor()
+            event.accept()
+            return
         if self.main_window.connecting and self.temp_connection:
             self.scene().removeItem(self.temp_connection)
             self.temp_connection = None
         super().mouseReleaseEvent(event)
+        if self.drag_start:
+            moved = [(component, start) for component, start in self.drag_start
+                     if component.scene() is self.scene() and component.pos() != start]
+            self.drag_start = None
+            if moved:
+                self.main_window.push_undo({"action": "move_components", "items": [component for component, _ in moved],
+                                            "old_positions": [(start.x(), start.y()) for _, start in moved],
+                                            "new_positions": [(component.pos().x(), component.pos().y()) for component, _ in moved]})
 
     def paintEvent(self, event):
+        if PROFILER.enabled:
+            start = PROFILER.timestamp()
+            PROFILER.take("FPGAComponent.paint")
         super().paintEvent(event)
+        if self.first_frame_callback is not None:
+            callback, self.first_frame_callback = self.first_frame_callback, None
+            callback()
+        painter = None
         if self.main_window.connecting and self.connection_start:
             painter = QPainter(self.viewport())
             painter.setPen(QPen(Qt.red, 2, Qt.DashLine))
             start_pos = self.mapFromScene(self.connection_start.scenePos())
             end_pos = self.mapFromGlobal(self.cursor().pos())
             painter.drawLine(start_pos, end_pos)
+        if PROFILER.enabled:
+            duration = PROFILER.timestamp() - start
+            PROFILER.record("GraphicsView.paintEvent", start, duration)
+            PROFILER.frame(duration)
+            PROFILER.stat("paints_per_frame", PROFILER.take("FPGAComponent.paint"))
+            if painter is None:
+                painter = QPainter(self.viewport())
+            self.draw_profiler_overlay(painter)
+
+    def drawForeground(self, painter, rect):
+        super().drawForeground(painter, rect)
+        if self.main_window.comparison is not None:
+            self.draw_comparison(painter, rect, self.main_window.comparison)
+        if self.transform().m11() < NET_MARKER_MIN_SCALE:
+            return  # Too small to see, and zoomed out views hold too many wires
+        scene = self.scene()
+        area = (rect.left(), rect.top(), rect.right(), rect.bottom())
+        if self.main_window.net_highlight:
+            # Wires of different nets drawn on top of each other cannot be told apart
+            painter.setPen(QPen(QColor(220, 0, 0), 3, Qt.DashLine))
+            for x1, y1, x2, y2, wire, other in scene.wire_index.overlaps_in(*area):
+                if not scene.same_net(wire, other):
+                    painter.drawLine(QPointF(x1, y1), QPointF(x2, y2))
+        # Wires that cross without a dot are not connected
+        junctions = {(x, y) for x, y, wire, other in scene.wire_index.crossings_in(*area) if scene.same_net(wire, other)}
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QBrush(Qt.black))
+        for x, y in junctions:
+            painter.drawEllipse(QPointF(x, y), JUNCTION_RADIUS, JUNCTION_RADIUS)
+
+    def draw_comparison(self, painter, rect, comparison):
+        """Mark what differs from the project the canvas is compared with.
+
+        Added parts and wires are green, removed ones red and dashed where
+        they used to be, moved parts orange with their old outline, and
+        changed or rewired parts blue.
+        """
+        from project_diff import connection_key
+        components = self.scene().components_by_id
+        painter.setBrush(Qt.NoBrush)
+
+        def outline(key, color):
+            component = components.get(key)
+            if component is not None:
+                bounds = component.sceneBoundingRect().adjusted(-4, -4, 4, 4)
+                if bounds.intersects(rect):
+                    painter.setPen(QPen(color, 3))
+                    painter.drawRect(bounds)
+
+        def old_bounds(data):
+            transform = QTransform().translate(data["x"], data["y"]).rotate(data.get("rotation", 0))
+            return transform.mapRect(QRectF(0, 0, data.get("width", 100), data.get("height", 50)))
+
+        for key in comparison.added:
+            outline(key, QColor(0, 160, 0))
+        for key in list(comparison.changed) + comparison.rewired:
+            outline(key, QColor(0, 90, 220))
+        for key in comparison.moved:
+            outline(key, QColor(230, 140, 0))
+            bounds = old_bounds(comparison.old_components[key])
+            if bounds.intersects(rect):
+                painter.setPen(QPen(QColor(230, 140, 0), 1, Qt.DashLine))
+                painter.drawRect(bounds)
+        painter.setPen(QPen(QColor(220, 0, 0), 2, Qt.DashLine))
+        for key in comparison.removed:
+            data = comparison.old_components[key]
+            bounds = old_bounds(data)
+            if bounds.intersects(rect):
+                painter.drawRect(bounds)
+                painter.drawText(bounds, Qt.AlignCenter, data.get("label", ""))
+        for (source, source_pin), (target, target_pin) in comparison.removed_connections:
+            # Wires of removed parts go with the part's outline
+            source, target = components.get(source), components.get(target)
+            if source is not None and target is not None and source_pin < len(source.pins) and target_pin < len(target.pins):
+                start, end = source.pins[source_pin].scenePos(), target.pins[target_pin].scenePos()
+                if QRectF(start, end).normalized().intersects(rect):
+                    painter.drawLine(start, end)
+        painter.setPen(QPen(QColor(0, 160, 0), 3))
+        for key in comparison.added_connections:
+            component = components.get(key[0][0])
+            for connection in component.connections if component is not None else ():
+                if connection_key(connection.to_dict()) == key and connection.sceneBoundingRect().intersects(rect):
+                    painter.drawPath(connection.path())
+
+    def draw_profiler_overlay(self, painter):
+        # Counting scene items walks the whole scene, so refresh it at most once a second
+        now = time.perf_counter()
+        if self.item_counts is None or now - self.item_counts_time > 1.0:
+            items = self.scene().items()
+            self.item_counts = (len(items),
+                                sum(1 for item in items if isinstance(item, FPGAComponent)),
+                                sum(1 for item in items if isinstance(item, Connection)))
+            self.item_counts_time = now
+
+        stats = PROFILER.stats
+        lines = [
+            "Frame: %.1f ms (avg %.1f ms)" % (stats.get("frame_ms", 0), PROFILER.average_frame_ms()),
+            "Paints/frame: %d" % stats.get("paints_per_frame", 0),
+            "Items visited/move: %d" % stats.get("items_visited_per_move", 0),
+            "Scene items: %d (%d components, %d wires)" % self.item_counts,
+            "Trace events: %d  [F3 hide, Shift+F3 save trace]" % len(PROFILER.events)
+        ]
+        painter.setFont(QFont("Courier", 9))
+        line_height = painter.fontMetrics().height()
+        width = max(painter.fontMetrics().width(line) for line in lines) + 16
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QBrush(QColor(0, 0, 0, 170)))
+        painter.drawRect(8, 8, width, line_height * len(lines) + 8)
+        painter.setPen(Qt.white)
+        for i, line in enumerate(lines):
+            painter.drawText(16, 12 + line_height * (i + 1) - painter.fontMetrics().descent(), line)
 
     def wheelEvent(self, event):
         if event.angleDelta().y() > 0:
@@ -378,23 +1092,139 @@ class GraphicsView(QGraphicsView):
         event.accept()
 
     def delete_component(self, component):
-        connections = []
-        for item in self.scene().items():
-            if isinstance(item, Connection):
-                if item.source.parentItem() == component or item.target.parentItem() == component:
-                    connections.append(item)
-                    self.scene().removeItem(item)
+        connections = list(component.connections)
+        for connection in connections:
+            self.scene().removeItem(connection)
         self.scene().removeItem(component)
-        self.main_window.undo_stack.append({"action": "delete_component", "item": component, "connections": connections})
-        self.main_window.redo_stack = []
+        self.main_window.push_undo({"action": "delete_component", "item": component, "connections": connections})
 
     def delete_connection(self, connection):
         self.scene().removeItem(connection)
-        self.main_window.undo_stack.append({"action": "delete_connection", "item": connection})
-        self.main_window.redo_stack = []
+        self.main_window.push_undo({"action": "delete_connection", "item": connection})
+
+class Minimap(QWidget):
+    """Overview of the whole design with the main view's visible area outlined.
+
+    The scene is drawn in a simplified style into a cached image the size of
+    the widget. Edits only mark the image tiles they touch, and a timer
+    redraws dirty tiles a few at a time so large edits do not block the
+    editor. Click or drag to move the main view.
+    """
+    def __init__(self, scene, view, parent=None):
+        super().__init__(parent)
+        self.scene = scene
+        self.view = view
+        self.image = None  # Cached render, None when it has to be redrawn completely
+        self.transform = QTransform()  # Scene to image coordinates
+        self.dirty_tiles = set()  # (column, row) of tiles to redraw
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh_tiles)
+        self.setMinimumSize(160, 120)
+        self.setCursor(Qt.PointingHandCursor)
+        scene.change_listeners.append(self.mark_dirty)
+        scene.sceneRectChanged.connect(lambda rect: self.invalidate())
+        # Scrolling and zooming move the outline of the visible area
+        for scroll_bar in (view.horizontalScrollBar(), view.verticalScrollBar()):
+            scroll_bar.valueChanged.connect(lambda value: self.update())
+            scroll_bar.rangeChanged.connect(lambda minimum, maximum: self.update())
+
+    def invalidate(self):
+        self.image = None
+        self.schedule_refresh()
+
+    def schedule_refresh(self):
+        if self.isVisible() and not self.refresh_timer.isActive():
+            self.refresh_timer.start(0)
+
+    def mark_dirty(self, rect):
+        if self.image is None:
+            return  # Everything gets redrawn anyway
+        area = self.transform.mapRect(rect)
+        columns = range(max(0, int(area.left()) // MINIMAP_TILE), min(self.image.width() - 1, int(area.right())) // MINIMAP_TILE + 1)
+        rows = range(max(0, int(area.top()) // MINIMAP_TILE), min(self.image.height() - 1, int(area.bottom())) // MINIMAP_TILE + 1)
+        self.dirty_tiles.update((column, row) for column in columns for row in rows)
+        self.schedule_refresh()
+
+    def reset_image(self):
+        """Fit the scene into a new image of the widget's size and mark every tile dirty."""
+        source = self.scene.content_rect()
+        width, height = self.width(), self.height()
+        scale = min(width / max(source.width(), 1), height / max(source.height(), 1))
+        self.transform = QTransform(scale, 0, 0, scale,
+                                    (width - source.width() * scale) / 2 - source.left() * scale,
+                                    (height - source.height() * scale) / 2 - source.top() * scale)
+        self.image = QImage(width, height, QImage.Format_RGB32)
+        self.dirty_tiles = {(column, row) for column in range((width - 1) // MINIMAP_TILE + 1)
+                            for row in range((height - 1) // MINIMAP_TILE + 1)}
+
+    @profiled("Minimap.refresh_tiles")
+    def refresh_tiles(self):
+        if self.image is None or self.image.size() != self.size():
+            self.reset_image()
+        start = time.perf_counter()
+        painter = QPainter(self.image)
+        try:
+            while self.dirty_tiles and time.perf_counter() - start < MINIMAP_REFRESH_BUDGET:
+                self.draw_tile(painter, *self.dirty_tiles.pop())
+        finally:
+            painter.end()
+        if not self.dirty_tiles:
+            self.refresh_timer.stop()
+        self.update()
+
+    def draw_tile(self, painter, column, row):
+        tile = QRectF(column * MINIMAP_TILE, row * MINIMAP_TILE, MINIMAP_TILE, MINIMAP_TILE)
+        painter.resetTransform()
+        painter.setClipRect(tile)
+        painter.fillRect(tile, Qt.white)
+        painter.setTransform(self.transform)
+        area = self.transform.inverted()[0].mapRect(tile)
+        # Pens of width 0 are one pixel wide at any scale, so tiny parts stay visible
+        wire_pen = QPen(QColor(120, 120, 120), 0)
+        body_pen = QPen(QColor(40, 40, 40), 0)
+        for item in self.scene.items(area, Qt.IntersectsItemBoundingRect, Qt.AscendingOrder):
+            if isinstance(item, Connection):
+                painter.setPen(wire_pen)
+                painter.setBrush(Qt.NoBrush)
+                painter.drawPath(item.path())
+            elif isinstance(item, FPGAComponent):
+                painter.setPen(body_pen)
+                painter.setBrush(QColor(40, 40, 40))
+                painter.drawRect(item.sceneBoundingRect())
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        if self.image is not None:
+            painter.drawImage(0, 0, self.image)
+        else:
+            painter.fillRect(self.rect(), Qt.white)
+        visible = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        painter.setPen(QPen(QColor(0, 120, 215), 1))
+        painter.setBrush(QColor(0, 120, 215, 40))
+        painter.drawRect(self.transform.mapRect(visible))
+        painter.end()
+
+    def resizeEvent(self, event):
+        self.invalidate()
+        super().resizeEvent(event)
+
+    def showEvent(self, event):
+        self.schedule_refresh()
+        super().showEvent(event)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.move_view(event.pos())
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.LeftButton:
+            self.move_view(event.pos())
+
+    def move_view(self, pos):
+        self.view.centerOn(self.transform.inverted()[0].map(QPointF(pos)))
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, autosave=True):
         super().__init__()
         self.setWindowTitle("FPGA Builder - Created by alby13")
         
@@ -405,15 +1235,14 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(central_widget)
         main_layout = QVBoxLayout(central_widget)
         
-        self.scene = QGraphicsScene()
+        self.scene = FPGAScene()
         self.view = GraphicsView(self.scene, self)
         
         # Adjust scene rect to match the screen size
         screen_rect = QApplication.desktop().screenGeometry()
         self.view.setSceneRect(0, 0, screen_rect.width(), screen_rect.height())
         self.view.setRenderHint(QPainter.Antialiasing)
-        
-        self.draw_grid()
+        self.scene.grid_rect = self.view.sceneRect()
         
         button_layout = QHBoxLayout()
         
@@ -422,6 +1251,14 @@ class MainWindow(QMainWindow):
         button_layout.addWidget(self.add_component_button)
 
         self.connecting = False
+        self.add_part_button = QPushButton("Add Library Part")
+        self.add_part_button.clicked.connect(self.add_library_part)
+        button_layout.addWidget(self.add_part_button)
+
+        self.add_block_button = QPushButton("Add Block")
+        self.add_block_button.clicked.connect(self.add_block)
+        button_layout.addWidget(self.add_block_button)
+
         self.add_connection_button = QPushButton("Add Connection")
         self.add_connection_button.clicked.connect(self.toggle_connection_mode)
         button_layout.addWidget(self.add_connection_button)
@@ -430,6 +1267,18 @@ class MainWindow(QMainWindow):
         self.rotate_component_button.clicked.connect(self.toggle_rotate_mode)
         button_layout.addWidget(self.rotate_component_button)
 
+        self.net_highlight_button = QPushButton("Net Highlight")
+        self.net_highlight_button.clicked.connect(self.toggle_net_highlight)
+        button_layout.addWidget(self.net_highlight_button)
+
+        self.array_button = QPushButton("Array Replicate")
+        self.array_button.clicked.connect(self.array_replicate)
+        button_layout.addWidget(self.array_button)
+
+        self.optimize_button = QPushButton("Optimize Placement")
+        self.optimize_button.clicked.connect(self.optimize_placement)
+        button_layout.addWidget(self.optimize_button)
+
         self.zoom_in_button = QPushButton("Zoom In")
         self.zoom_in_button.clicked.connect(self.zoom_in)
         button_layout.addWidget(self.zoom_in_button)
@@ -450,6 +1299,10 @@ class MainWindow(QMainWindow):
         self.load_project_button.clicked.connect(self.load_project)
         button_layout.addWidget(self.load_project_button)
 
+        self.compare_button = QPushButton("Compare With...")
+        self.compare_button.clicked.connect(self.toggle_comparison)
+        button_layout.addWidget(self.compare_button)
+
         self.undo_button = QPushButton("Undo")
         self.undo_button.clicked.connect(self.undo)
         button_layout.addWidget(self.undo_button)
@@ -466,37 +1319,426 @@ class MainWindow(QMainWindow):
         main_layout.addWidget(self.view)
         
         self.rotating = False
+        self.net_highlight = False
+        self.highlighted_net = set()  # Wires drawn highlighted in net highlight mode
+        # Comparison with a saved project, redone a moment after each edit
+        self.comparison = None
+        self.comparison_base = None
+        self.comparison_timer = QTimer(self)
+        self.comparison_timer.setSingleShot(True)
+        self.comparison_timer.timeout.connect(self.update_comparison)
+        self.comparison_listener = lambda rect: self.comparison_timer.start(COMPARISON_DELAY)
         self.connection_source = None
         self.undo_stack = []
         self.redo_stack = []
+        self.block_definitions = {}
+        self.block_renames = {}  # Names of blocks defined by applied edits -> names they were registered under
+        self.block_windows = {}
+
+        QShortcut(QKeySequence.SelectAll, self, self.select_all)
+        QShortcut(QKeySequence.Delete, self, self.delete_selection)
+        QShortcut(QKeySequence.Copy, self, self.copy_selection)
+        QShortcut(QKeySequence.Paste, self, self.paste)
+        QShortcut(QKeySequence("R"), self, lambda: self.rotate_components(self.selected_components()))
+        self.paste_count = 0  # Pastes since the last copy, each one lands a bit further away
+
+        QShortcut(QKeySequence("F2"), self, self.rename_selection)
+
+        # Find panel: matches of the typed text among labels, types and net names
+        self.find_edit = QLineEdit()
+        self.find_edit.setPlaceholderText("Find component or net")
+        self.find_edit.textChanged.connect(self.update_find_results)
+        self.find_list = QListWidget()
+        self.find_list.currentRowChanged.connect(self.show_find_result)
+        self.find_results = []
+        find_widget = QWidget()
+        find_layout = QVBoxLayout(find_widget)
+        find_layout.addWidget(self.find_edit)
+        find_layout.addWidget(self.find_list)
+        self.find_dock = QDockWidget("Find", self)
+        self.find_dock.setWidget(find_widget)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.find_dock)
+        self.find_dock.hide()
+        QShortcut(QKeySequence.Find, self, self.show_find_panel)
+
+        self.minimap = Minimap(self.scene, self.view)
+        self.minimap_dock = QDockWidget("Minimap", self)
+        self.minimap_dock.setWidget(self.minimap)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.minimap_dock)
+        QShortcut(QKeySequence("M"), self, lambda: self.minimap_dock.setVisible(not self.minimap_dock.isVisible()))
+
+        QShortcut(QKeySequence("F3"), self, self.toggle_profiler)
+        QShortcut(QKeySequence("Shift+F3"), self, self.save_profiler_trace)
+
+        # Crash recovery: every edit is appended to the autosave journal,
+        # which start_autosave() opens once the window is on screen
+        self.autosave = autosave
+        self.journal = None
+        self.collab = None  # Collaboration client, see join_session()
         
+    def start_autosave(self):
+        if not self.autosave or self.journal is not None:
+            return
+        from journal import EditJournal
+        self.journal = EditJournal(AUTOSAVE_DIR)
+        self.compact_timer = QTimer(self)
+        self.compact_timer.timeout.connect(self.compact_journal)
+        self.compact_timer.start(JOURNAL_COMPACT_INTERVAL)
+
     def add_component(self):
         dialog = ComponentDialog(self)
         if dialog.exec_():
             data = dialog.get_data()
         
-            if data["component_type"] == "IC Chip":
-                if data["chip_type"] == "Regular":
-                    width, height = 100, 50
-                elif data["chip_type"] == "Wide":
-                    width, height = 150, 50
-                else:  # Square
-                    width, height = 100, 100
-            elif data["component_type"] == "Capacitor":
-                width, height = 20, 40 
-            elif data["component_type"] in ["Resistor", "Inductor"]:
-                width, height = 60, 20
-            elif data["component_type"] == "Crystal Oscillator":
-                width, height = 40, 60
-            elif data["component_type"] == "Diode":
-                width, height = 40, 40
-            elif data["component_type"] == "DIP Switch":
-                width, height = max(20, data["pin_count"] * 10), 30
+            if data["component_type"] == "Port":
+                data["pin_count"] = 1
+            width, height = library.component_size(data["component_type"], data["chip_type"], data["pin_count"])
         
-            component = FPGAComponent(0, 0, width, height, data["label"], data["pin_count"], data["pin_orientation"], data["component_type"])
+            component = FPGAComponent(0, 0, width, height, data["label"], data["pin_count"], data["pin_orientation"], data["component_type"],
+                                      chip_type=data["chip_type"])
             self.scene.addItem(component)
-            self.undo_stack.append({"action": "add_component", "item": component})
-            self.redo_stack = []
+            self.push_undo({"action": "add_component", "item": component})
+
+    def add_library_part(self):
+        dialog = LibraryDialog(self)
+        if dialog.exec_():
+            data = dialog.get_data()
+            if data["part"] is None:
+                return
+            try:
+                part = LIBRARY.get(data["part"])
+            except (KeyError, ValueError) as error:
+                QMessageBox.warning(self, "Add Library Part", "Cannot read part: %s" % error)
+                return
+            component = LibraryPart(0, 0, part, data["label"])
+            self.scene.addItem(component)
+            self.push_undo({"action": "add_component", "item": component})
+
+    def add_block(self):
+        filename, _ = QFileDialog.getOpenFileName(self, "Add Block", "", "FPGA Builder Project Files (*.fga);;All Files (*)")
+        if not filename:
+            return
+        name = os.path.splitext(os.path.basename(filename))[0]
+        # Read the file every time: another file of the same name, or an
+        # edited one, becomes a definition of its own
+        try:
+            with open(filename, "r") as file:
+                project_data = json.load(file)
+            check_version(project_data)
+            name = self.define_blocks({name: project_data})[name]
+        except (OSError, KeyError, IndexError, ValueError) as error:
+            QMessageBox.warning(self, "Add Block", "Could not read %s: %s" % (filename, error))
+            return
+        label, ok = QInputDialog.getText(self, "Add Block", "Instance Label:")
+        if not ok:
+            return
+        component = BlockInstance(0, 0, self.block_definitions[name], label)
+        self.scene.addItem(component)
+        self.push_undo({"action": "add_component", "item": component})
+
+    def define_blocks(self, blocks):
+        """Register block definitions, including nested ones, that are not known yet.
+
+        Returns {name in blocks: name registered under}, see register_block_definitions().
+        """
+        names = set(self.block_definitions)
+        try:
+            return register_block_definitions(self.block_definitions, blocks)
+        finally:
+            # Journal the new definitions, also those registered before a
+            # broken one stopped the rest, so recovery can rebuild their instances
+            self.record_ops([{"op": "define_block", "name": name, "project_data": definition.project_data}
+                             for name, definition in self.block_definitions.items() if name not in names])
+
+    def used_blocks(self, components_data):
+        """Return the definitions that the given components need, nested ones included."""
+        blocks = {}
+        pending = [component["block"] for component in components_data if "block" in component]
+        while pending:
+            name = pending.pop()
+            if name not in blocks:
+                blocks[name] = self.block_definitions[name].project_data
+                pending.extend(component["block"] for component in blocks[name]["components"] if "block" in component)
+        return blocks
+
+    def open_block(self, definition):
+        window = self.block_windows.get(definition.name)
+        if window is None:
+            try:
+                scene = definition.expand()
+            except (OSError, KeyError, IndexError, ValueError) as error:
+                QMessageBox.warning(self, "Open Block", "Could not open block %s: %s" % (definition.name, error))
+                return
+            window = QDialog(self)
+            window.setWindowTitle("Block: %s" % definition.name)
+            layout = QVBoxLayout(window)
+            view = QGraphicsView(scene)
+            view.setRenderHint(QPainter.Antialiasing)
+            view.setInteractive(False)  # Edit the block's own project file to change it
+            layout.addWidget(view)
+            window.resize(800, 600)
+            self.block_windows[definition.name] = window
+        window.show()
+        window.raise_()
+
+    def optimize_placement(self):
+        components = [item for item in self.scene.items() if isinstance(item, FPGAComponent)]
+        if not components:
+            return
+        import placement  # Pulls in multiprocessing, so only on first use
+
+        blocks = []
+        pins = []
+        pin_index = {}
+        for index, component in enumerate(components):
+            pos = component.pos()
+            bounds = component.sceneBoundingRect().translated(-pos)
+            blocks.append((pos.x(), pos.y(), bounds.left(), bounds.top(), bounds.width(), bounds.height()))
+            for pin in component.pins:
+                offset = component.mapToScene(pin.rect().center()) - pos
+                pin_index[pin] = len(pins)
+                pins.append((index, offset.x(), offset.y()))
+
+        nets = []
+        for item in self.scene.items():
+            if isinstance(item, Connection) and item.source in pin_index and item.target in pin_index:
+                nets.append((pin_index[item.source], pin_index[item.target]))
+
+        # The parts' own area, grown so there is room to rearrange them
+        rect = QRectF()
+        for component in components:
+            rect = rect.united(component.sceneBoundingRect())
+        bounds = placement.fit_bounds(blocks, (rect.left(), rect.top(), rect.right(), rect.bottom()), GRID_SIZE)
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            positions = placement.optimize_placement(blocks, pins, nets, iterations=max(20000, 200 * len(components)),
+                                                     workers=min(4, os.cpu_count() or 1), grid=GRID_SIZE, bounds=bounds)
+        except ValueError as error:
+            QMessageBox.warning(self, "Optimize Placement", str(error))
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        old_positions = [(component.pos().x(), component.pos().y()) for component in components]
+        self.move_components(components, positions)
+        self.push_undo({"action": "move_components", "items": components,
+                        "old_positions": old_positions, "new_positions": positions})
+
+    def selected_components(self):
+        return [item for item in self.scene.selectedItems() if isinstance(item, FPGAComponent)]
+
+    def selected_connections(self):
+        return [item for item in self.scene.selectedItems() if isinstance(item, Connection)]
+
+    def select_all(self):
+        for item in self.scene.items():
+            if isinstance(item, (FPGAComponent, Connection)):
+                item.setSelected(True)
+
+    def move_components(self, components, positions):
+        with self.scene.batch():
+            for component, (x, y) in zip(components, positions):
+                component.setPos(x, y)
+
+    def set_rotations(self, components, rotations):
+        with self.scene.batch():
+            for component, rotation in zip(components, rotations):
+                component.set_rotation(rotation)
+
+    def turn_components(self, components, rotations, positions):
+        with self.scene.batch():
+            self.set_rotations(components, rotations)
+            self.move_components(components, positions)
+
+    def rotate_components(self, components):
+        """Turn components a quarter turn clockwise as one undo step.
+
+        Several components turn together about the centre of the selection,
+        so their layout and the wires between them turn with them.
+        """
+        if not components:
+            return
+        old_rotations = [component.rotation_angle for component in components]
+        new_rotations = [(rotation + 90) % 360 for rotation in old_rotations]
+        old_positions = [(component.pos().x(), component.pos().y()) for component in components]
+        new_positions = old_positions
+        if len(components) > 1:
+            bounds = QRectF()
+            for component in components:
+                bounds = bounds.united(component.sceneBoundingRect())
+            centre_x = round(bounds.center().x() / GRID_SIZE) * GRID_SIZE
+            centre_y = round(bounds.center().y() / GRID_SIZE) * GRID_SIZE
+            # A component turns about its position, so turning its position
+            # about the centre too keeps it in place within the group. A
+            # quarter turn clockwise takes (dx, dy) from the centre to (-dy, dx).
+            new_positions = [(round((centre_x - (y - centre_y)) / GRID_SIZE) * GRID_SIZE,
+                              round((centre_y + (x - centre_x)) / GRID_SIZE) * GRID_SIZE) for x, y in old_positions]
+        self.turn_components(components, new_rotations, new_positions)
+        self.push_undo({"action": "rotate_components", "items": components,
+                        "old_rotations": old_rotations, "new_rotations": new_rotations,
+                        "old_positions": old_positions, "new_positions": new_positions})
+
+    def rename_selection(self):
+        components = self.selected_components()
+        if len(components) != 1:
+            return
+        component = components[0]
+        label, ok = QInputDialog.getText(self, "Rename Component", "Label:", text=component.label)
+        if ok and label != component.label:
+            old_label = component.label
+            component.setLabel(label)
+            self.push_undo({"action": "rename_component", "item": component, "old_label": old_label, "new_label": label})
+
+    def show_find_panel(self):
+        self.find_dock.show()
+        self.find_edit.setFocus()
+        self.find_edit.selectAll()
+
+    def update_find_results(self, text):
+        index = self.scene.search_index
+        self.find_results = index.search(text, FIND_RESULT_LIMIT)
+        self.find_list.blockSignals(True)
+        self.find_list.clear()
+        self.find_list.addItems([index.display(item) for item in self.find_results])
+        self.find_list.blockSignals(False)
+
+    def show_find_result(self, row):
+        """Select a find result together with its wires and scroll it into view."""
+        if not 0 <= row < len(self.find_results):
+            return
+        item = self.find_results[row]
+        if item.scene() is not self.scene:
+            return  # Deleted since the search ran
+        wires = item.connections if isinstance(item, FPGAComponent) else net_connections(item)
+        self.scene.clearSelection()
+        item.setSelected(True)
+        for wire in wires:
+            wire.setSelected(True)
+        self.view.centerOn(item)
+
+    def insert_items(self, components, connections):
+        # Hold back repaints until everything is in the scene
+        self.view.setUpdatesEnabled(False)
+        try:
+            with self.scene.batch():
+                for component in components:
+                    self.scene.addItem(component)
+                for connection in connections:
+                    self.scene.addItem(connection)
+        finally:
+            self.view.setUpdatesEnabled(True)
+
+    def remove_items(self, components, connections):
+        for connection in connections:
+            self.scene.removeItem(connection)
+        for component in components:
+            self.scene.removeItem(component)
+
+    def delete_selection(self):
+        components = self.selected_components()
+        # Every wire is collected once, whether it was selected or is attached to a deleted component
+        connections = set(self.selected_connections())
+        for component in components:
+            connections.update(component.connections)
+        if not components and not connections:
+            return
+        connections = list(connections)
+        self.remove_items(components, connections)
+        self.push_undo({"action": "delete_items", "components": components, "connections": connections})
+
+    def selection_data(self):
+        """Return the selected components and the wires between them as project data."""
+        components = self.selected_components()
+        selected = set(components)
+        connections = set()
+        for component in components:
+            for connection in component.connections:
+                if connection.source.parent_component in selected and connection.target.parent_component in selected:
+                    connections.add(connection)
+        components_data = [component.to_dict() for component in components]
+        return {
+            "version": PROJECT_VERSION,
+            "components": components_data,
+            "connections": [connection.to_dict() for connection in connections],
+            "blocks": self.used_blocks(components_data)
+        }
+
+    def copy_selection(self):
+        if not self.selected_components():
+            return
+        # The selection goes on the system clipboard, so it can be pasted into another window
+        mime_data = QMimeData()
+        mime_data.setData(CLIPBOARD_MIME_TYPE, json.dumps(self.selection_data()).encode("utf-8"))
+        QApplication.clipboard().setMimeData(mime_data)
+        self.paste_count = 0
+
+    def paste(self):
+        mime_data = QApplication.clipboard().mimeData()
+        if mime_data is None or not mime_data.hasFormat(CLIPBOARD_MIME_TYPE):
+            return
+        try:
+            project_data = json.loads(bytes(mime_data.data(CLIPBOARD_MIME_TYPE)).decode("utf-8"))
+        except ValueError:
+            return
+        rename_blocks(project_data["components"], self.define_blocks(project_data.get("blocks", {})))
+        self.paste_count += 1
+        offset = self.paste_count * PASTE_OFFSET
+        self.add_items(project_data, [(offset, offset)])
+
+    def array_replicate(self):
+        project_data = self.selection_data()
+        if not project_data["components"]:
+            QMessageBox.information(self, "Array Replicate", "Select the components to replicate first.")
+            return
+        # Default pitch: the size of the selection plus one grid cell
+        bounds = QRectF()
+        for component in self.selected_components():
+            bounds = bounds.united(component.sceneBoundingRect())
+        pitch_x = (int(bounds.width()) // GRID_SIZE + 2) * GRID_SIZE
+        pitch_y = (int(bounds.height()) // GRID_SIZE + 2) * GRID_SIZE
+        dialog = ArrayDialog(pitch_x, pitch_y, self)
+        if dialog.exec_():
+            data = dialog.get_data()
+            # The selection itself is the copy in the first row and column
+            offsets = [(column * data["pitch_x"], row * data["pitch_y"])
+                       for row in range(data["rows"]) for column in range(data["columns"]) if row or column]
+            if offsets:
+                self.add_items(project_data, offsets)
+
+    def add_items(self, project_data, offsets):
+        """Add one copy of project data per (dx, dy) offset as a single undo step."""
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            components, connections = self.build_items(project_data, offsets)
+            self.insert_items(components, connections)
+            self.scene.clearSelection()
+            for component in components:
+                component.setSelected(True)
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.push_undo({"action": "add_items", "components": components, "connections": connections})
+
+    def build_items(self, project_data, offsets=((0, 0),)):
+        """Create new components and connections from project data, one copy per (dx, dy) offset.
+
+        The copies get fresh component ids. Connections to components outside
+        the data are dropped.
+        """
+        all_components = []
+        all_connections = []
+        for dx, dy in offsets:
+            components = {}
+            for component_data in project_data["components"]:
+                data = dict(component_data, id=None, x=component_data["x"] + dx, y=component_data["y"] + dy)
+                components[component_data["id"]] = FPGAComponent.from_dict(data, self.block_definitions)
+            for connection_data in project_data["connections"]:
+                source = components.get(connection_data["source_id"])
+                target = components.get(connection_data["target_id"])
+                if source is not None and target is not None:
+                    all_connections.append(Connection(source.pins[connection_data["source_pin_index"]],
+                                                      target.pins[connection_data["target_pin_index"]]))
+            all_components.extend(components.values())
+        return all_components, all_connections
 
     def toggle_connection_mode(self):
         self.connecting = not self.connecting
@@ -521,30 +1763,321 @@ class MainWindow(QMainWindow):
             self.rotate_component_button.setText("Rotate Mode")
             self.view.setCursor(Qt.ArrowCursor)
 
+    def toggle_net_highlight(self):
+        self.net_highlight = not self.net_highlight
+        if self.net_highlight:
+            self.net_highlight_button.setText("Cancel Net Highlight")
+        else:
+            self.net_highlight_button.setText("Net Highlight")
+            self.set_highlighted_net(set())
+            self.statusBar().clearMessage()
+        self.view.viewport().update()
+
+    def highlight_net_at(self, pos, tolerance):
+        """Highlight the net of the wire at pos and name its pins in the status bar."""
+        wire = self.scene.wire_index.wire_at(pos.x(), pos.y(), tolerance)
+        if wire is None:
+            if self.highlighted_net:
+                self.set_highlighted_net(set())
+                self.statusBar().clearMessage()
+            return
+        if wire in self.highlighted_net:
+            return
+        net = net_connections(wire)
+        self.set_highlighted_net(net)
+        names = sorted({pin.net_name() for connection in net for pin in (connection.source, connection.target)})
+        shown = ", ".join(names[:8]) + (", ..." if len(names) > 8 else "")
+        self.statusBar().showMessage("Net: %s (%d pins, %d wires)" % (shown, len(names), len(net)))
+
+    def set_highlighted_net(self, net):
+        for connection in self.highlighted_net - net:
+            connection.set_highlighted(False)
+        for connection in net - self.highlighted_net:
+            connection.set_highlighted(True)
+        self.highlighted_net = net
+
+    def toggle_comparison(self):
+        """Mark how the canvas differs from a saved project, or stop doing so."""
+        if self.comparison is not None:
+            self.scene.change_listeners.remove(self.comparison_listener)
+            self.comparison_timer.stop()
+            self.comparison = None
+            self.comparison_base = None
+            self.compare_button.setText("Compare With...")
+            self.statusBar().clearMessage()
+            self.scene.invalidate(self.scene.sceneRect(), QGraphicsScene.ForegroundLayer)
+            return
+        filename, _ = QFileDialog.getOpenFileName(self, "Compare With", "", "FPGA Builder Project Files (*.fga);;All Files (*)")
+        if not filename:
+            return
+        try:
+            with open(filename, "r") as file:
+                self.comparison_base = json.load(file)
+            self.update_comparison()
+        except (KeyError, ValueError) as error:
+            self.comparison_base = None
+            QMessageBox.warning(self, "Compare With", "Could not compare with %s: %s" % (filename, error))
+            return
+        self.scene.change_listeners.append(self.comparison_listener)
+        self.compare_button.setText("Stop Comparing")
+
+    def update_comparison(self):
+        from project_diff import ProjectDiff
+        self.comparison = ProjectDiff(self.comparison_base, self.project_data())
+        counts = self.comparison.counts()
+        self.statusBar().showMessage("Compared with the saved project: %(added)d added, %(removed)d removed, "
+                                     "%(moved)d moved, %(changed)d changed, %(rewired)d rewired" % counts)
+        self.scene.invalidate(self.scene.sceneRect(), QGraphicsScene.ForegroundLayer)
+
+    def toggle_profiler(self):
+        PROFILER.enable(not PROFILER.enabled)
+        self.view.item_counts = None
+        self.view.viewport().update()
+
+    def save_profiler_trace(self):
+        if not PROFILER.events:
+            QMessageBox.information(self, "Save Trace", "Nothing recorded yet. Press F3 to turn the profiler on.")
+            return
+        filename, _ = QFileDialog.getSaveFileName(self, "Save Trace", "", "Chrome Trace Files (*.json);;All Files (*)")
+        if filename:
+            PROFILER.dump_trace(filename)
+
     def zoom_in(self):
         self.view.scale(1.25, 1.25)
 
     def zoom_out(self):
         self.view.scale(0.8, 0.8)
 
-    def draw_grid(self):
-        rect = self.view.sceneRect()
-        for x in range(int(rect.left()), int(rect.right()), GRID_SIZE):
-            line = self.scene.addLine(x, rect.top(), x, rect.bottom(), QPen(Qt.lightGray))
-            line.setZValue(-2)  # Set grid lines below everything else
-        for y in range(int(rect.top()), int(rect.bottom()), GRID_SIZE):
-            line = self.scene.addLine(rect.left(), y, rect.right(), y, QPen(Qt.lightGray))
-            line.setZValue(-2)  # Set grid lines below everything else
-
     def save_image(self):
         filename, _ = QFileDialog.getSaveFileName(self, "Save Image", "", "PNG Files (*.png);;All Files (*)")
         if filename:
-            pixmap = QPixmap(self.scene.sceneRect().size().toSize())
-            pixmap.fill(Qt.white)
-            painter = QPainter(pixmap)
-            self.scene.render(painter)
-            painter.end()
-            pixmap.save(filename)
+            self.export_image(filename)
+
+    def export_image(self, filename):
+        rect = self.scene.content_rect()
+        pixmap = QPixmap(rect.size().toSize())
+        pixmap.fill(Qt.white)
+        painter = QPainter(pixmap)
+        self.scene.render(painter, QRectF(pixmap.rect()), rect)
+        painter.end()
+        pixmap.save(filename)
+
+    def push_undo(self, action):
+        self.undo_stack.append(action)
+        self.redo_stack = []
+        self.journal_action(action)
+
+    def journal_action(self, action, undo=False):
+        self.record_ops(self.action_ops(action, undo))
+
+    def record_ops(self, ops, publish=True):
+        """Journal edit operations and, unless they came from collaborators, send them to them."""
+        if publish and self.collab is not None:
+            self.collab.send_ops(ops)
+        if self.journal is not None:
+            self.journal.record(ops)
+            if self.journal.pending >= JOURNAL_COMPACT_THRESHOLD:
+                self.compact_journal()
+
+    def compact_journal(self, force=False):
+        if self.journal is not None and (force or self.journal.pending):
+            self.journal.compact(self.project_data())
+
+    def action_ops(self, action, undo=False):
+        """Return the edit operations that redo an undo stack entry, or undo it if undo is True."""
+        kind = action["action"]
+        if kind in ("add_component", "delete_component"):
+            component = action["item"]
+            add = [{"op": "add_component", "component": component.to_dict()}]
+            add += [{"op": "add_connection", "connection": connection.to_dict()} for connection in action.get("connections", [])]
+            remove = [{"op": "delete_component", "id": component.component_id}]
+            return remove if (kind == "add_component") == undo else add
+        if kind in ("add_connection", "delete_connection"):
+            connection_data = action["item"].to_dict()
+            add = [{"op": "add_connection", "connection": connection_data}]
+            remove = [{"op": "delete_connection", "connection": connection_data}]
+            return remove if (kind == "add_connection") == undo else add
+        if kind in ("add_items", "delete_items"):
+            add = [{"op": "add_component", "component": component.to_dict()} for component in action["components"]]
+            add += [{"op": "add_connection", "connection": connection.to_dict()} for connection in action["connections"]]
+            remove = [{"op": "delete_connection", "connection": connection.to_dict()} for connection in action["connections"]]
+            remove += [{"op": "delete_component", "id": component.component_id} for component in action["components"]]
+            return remove if (kind == "add_items") == undo else add
+        if kind == "move_components":
+            positions = action["old_positions"] if undo else action["new_positions"]
+            return [{"op": "move", "id": component.component_id, "x": x, "y": y}
+                    for component, (x, y) in zip(action["items"], positions)]
+        if kind == "rotate_components":
+            rotations = action["old_rotations"] if undo else action["new_rotations"]
+            positions = action["old_positions"] if undo else action["new_positions"]
+            return ([{"op": "rotate", "id": component.component_id, "rotation": rotation}
+                     for component, rotation in zip(action["items"], rotations)] +
+                    [{"op": "move", "id": component.component_id, "x": x, "y": y}
+                     for component, (x, y) in zip(action["items"], positions)])
+        if kind == "rename_component":
+            return [{"op": "rename", "id": action["item"].component_id,
+                     "label": action["old_label"] if undo else action["new_label"]}]
+        return []
+
+    def apply_ops(self, ops):
+        """Apply edit operations to the scene without touching the undo history.
+
+        Operations that refer to components which no longer exist are skipped.
+        So are operations that cannot be applied here, such as a library part
+        this machine does not have; those are returned as (op, error) pairs.
+        Only the items the operations touch are changed and redrawn.
+        """
+        with self.scene.batch():
+            return self.apply_ops_to(self.scene.components_by_id, ops)
+
+    def apply_ops_to(self, components, ops):
+        # components is the scene's own id map, which adding and removing
+        # components keeps up to date
+        skipped = []
+        for op in ops:
+            try:
+                self.apply_op(components, op)
+            except (KeyError, IndexError, ValueError) as error:
+                skipped.append((op, error))
+        return skipped
+
+    def apply_op(self, components, op):
+        kind = op["op"]
+        if kind == "define_block":
+            # A collaborator's definition may clash with a different local one of the same name
+            self.block_renames.update(register_block_definitions(self.block_definitions,
+                                                                 {op["name"]: op["project_data"]}))
+        elif kind == "add_component":
+            if op["component"].get("id") in components:
+                return  # Already there, e.g. an edit received twice
+            data = dict(op["component"])
+            rename_blocks([data], self.block_renames)
+            self.scene.addItem(FPGAComponent.from_dict(data, self.block_definitions))
+        elif kind == "delete_component":
+            component = components.get(op["id"])
+            if component is None:
+                return
+            for connection in list(component.connections):
+                self.scene.removeItem(connection)
+            self.scene.removeItem(component)
+        elif kind == "add_connection":
+            data = op["connection"]
+            source = components.get(data["source_id"])
+            target = components.get(data["target_id"])
+            if source is None or target is None:
+                return
+            connection = Connection(source.pins[data["source_pin_index"]], target.pins[data["target_pin_index"]])
+            self.scene.addItem(connection)
+            connection.setZValue(-1)  # Ensure connections are below components
+        elif kind == "delete_connection":
+            source = components.get(op["connection"]["source_id"])
+            for connection in list(source.connections) if source is not None else []:
+                if connection.to_dict() == op["connection"]:
+                    self.scene.removeItem(connection)
+                    break
+        elif kind == "move":
+            component = components.get(op["id"])
+            if component is not None:
+                component.setPos(op["x"], op["y"])
+        elif kind == "rotate":
+            component = components.get(op["id"])
+            if component is not None:
+                component.set_rotation(op["rotation"])
+        elif kind == "rename":
+            component = components.get(op["id"])
+            if component is not None:
+                component.setLabel(op["label"])
+
+    def offer_recovery(self):
+        if self.journal is None:
+            return
+        # Only sessions of editors that are no longer running; other open
+        # windows keep their journals to themselves
+        from journal import claim_orphaned_session
+        session = claim_orphaned_session(AUTOSAVE_DIR)
+        if session is None:
+            return
+        reply = QMessageBox.question(self, "Recover Design",
+                                     "FPGA Builder was not closed properly. Restore the design from the last session?",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+        if reply == QMessageBox.Yes:
+            snapshot, ops = session.read()
+            try:
+                self.load_project_data(snapshot or {"version": PROJECT_VERSION, "components": [], "connections": []})
+                skipped = self.apply_ops(ops)
+            except (KeyError, IndexError, ValueError) as error:
+                QMessageBox.warning(self, "Recover Design", "Could not restore the design: %s" % error)
+            else:
+                if skipped:
+                    QMessageBox.warning(self, "Recover Design", "%d edits could not be restored, the first because of %r"
+                                        % (len(skipped), skipped[0][1]))
+        session.remove()
+        # Start this session's journal from whatever is on the canvas now
+        self.compact_journal(force=True)
+
+    def join_session(self, host, port):
+        """Share the design with everyone connected to the collaboration server at host:port."""
+        from collab import CollabClient
+        self.collab = CollabClient(host, port)
+        self.collab_timer = QTimer(self)
+        self.collab_timer.timeout.connect(self.receive_collab_messages)
+        self.collab_timer.start(COLLAB_POLL_INTERVAL)
+        self.statusBar().showMessage("Collaboration: connecting to %s:%d" % (host, port))
+
+    def leave_session(self):
+        if self.collab is not None:
+            self.collab_timer.stop()
+            self.collab.close()
+            self.collab = None
+
+    def receive_collab_messages(self):
+        for message in self.collab.poll():
+            if message["t"] == "state":
+                if message["project"] is None and not message["ops"]:
+                    # First one in: the session starts from this design
+                    self.collab.send_snapshot(self.project_data())
+                else:
+                    try:
+                        self.load_project_data(message["project"] or
+                                               {"version": PROJECT_VERSION, "components": [], "connections": []})
+                    except (KeyError, IndexError, ValueError) as error:
+                        # Without the shared design, later edits would not apply to anything
+                        self.statusBar().showMessage("Collaboration: could not load the shared design (%r), "
+                                                     "left the session" % error)
+                        self.leave_session()
+                        return
+                    skipped = self.apply_ops(message["ops"])
+                    self.compact_journal(force=True)
+                    if skipped:
+                        self.report_skipped_ops(skipped)
+                        continue
+                self.statusBar().showMessage("Collaboration: connected to %s:%d" % (self.collab.host, self.collab.port))
+            elif message["t"] == "ops":
+                ops = message["ops"]
+                skipped = self.apply_ops(ops)
+                if skipped:
+                    self.report_skipped_ops(skipped)
+                    failed = {id(op) for op, _ in skipped}
+                    ops = [op for op in ops if id(op) not in failed]
+                self.record_ops(ops, publish=False)
+            elif message["t"] == "closed":
+                self.statusBar().showMessage("Collaboration: disconnected (%s)" % message["reason"])
+                self.leave_session()
+                return
+
+    def report_skipped_ops(self, skipped):
+        # A collaborator's edit that does not apply here, for instance because
+        # it uses a library part this machine lacks, must not end the session
+        self.statusBar().showMessage("Collaboration: skipped %d edits that do not apply here, the first because of %r"
+                                     % (len(skipped), skipped[0][1]))
+
+    def closeEvent(self, event):
+        self.leave_session()
+        if self.journal is not None:
+            self.journal.discard()
+            self.journal.close()
+            self.journal = None
+        super().closeEvent(event)
 
     def undo(self):
         if self.undo_stack:
@@ -563,6 +2096,22 @@ class MainWindow(QMainWindow):
             elif action["action"] == "delete_connection":
                 self.scene.addItem(action["item"])
                 self.redo_stack.append(action)
+            elif action["action"] == "add_items":
+                self.remove_items(action["components"], action["connections"])
+                self.redo_stack.append(action)
+            elif action["action"] == "delete_items":
+                self.insert_items(action["components"], action["connections"])
+                self.redo_stack.append(action)
+            elif action["action"] == "move_components":
+                self.move_components(action["items"], action["old_positions"])
+                self.redo_stack.append(action)
+            elif action["action"] == "rotate_components":
+                self.turn_components(action["items"], action["old_rotations"], action["old_positions"])
+                self.redo_stack.append(action)
+            elif action["action"] == "rename_component":
+                action["item"].setLabel(action["old_label"])
+                self.redo_stack.append(action)
+            self.journal_action(action, undo=True)
 
     def redo(self):
         if self.redo_stack:
@@ -581,61 +2130,127 @@ class MainWindow(QMainWindow):
             elif action["action"] == "delete_connection":
                 self.scene.removeItem(action["item"])
                 self.undo_stack.append(action)
+            elif action["action"] == "add_items":
+                self.insert_items(action["components"], action["connections"])
+                self.undo_stack.append(action)
+            elif action["action"] == "delete_items":
+                self.remove_items(action["components"], action["connections"])
+                self.undo_stack.append(action)
+            elif action["action"] == "move_components":
+                self.move_components(action["items"], action["new_positions"])
+                self.undo_stack.append(action)
+            elif action["action"] == "rotate_components":
+                self.turn_components(action["items"], action["new_rotations"], action["new_positions"])
+                self.undo_stack.append(action)
+            elif action["action"] == "rename_component":
+                action["item"].setLabel(action["new_label"])
+                self.undo_stack.append(action)
+            self.journal_action(action)
 
     def save_project(self):
         filename, _ = QFileDialog.getSaveFileName(self, "Save Project", "", "FPGA Builder Project Files (*.fga);;All Files (*)")
         if filename:
             if not filename.endswith(".fga"):
                 filename += ".fga"
-            project_data = {
-                "components": [],
-                "connections": []
-            }
-            for item in self.scene.items():
-                if isinstance(item, FPGAComponent):
-                    component_data = {
-                        "label": item.label,
-                        "pin_count": item.pin_count,
-                        "pin_orientation": item.pin_orientation,
-                        "x": item.scenePos().x(),
-                        "y": item.scenePos().y()
-                    }
-                    project_data["components"].append(component_data)
-                elif isinstance(item, Connection):
-                    connection_data = {
-                        "source_label": item.source.parentItem().label,
-                        "source_pin_index": item.source.parentItem().pins.index(item.source),
-                        "target_label": item.target.parentItem().label,
-                        "target_pin_index": item.target.parentItem().pins.index(item.target)
-                    }
-                    project_data["connections"].append(connection_data)
-            with open(filename, "w") as file:
-                json.dump(project_data, file)
+            self.write_project(filename)
 
     def load_project(self):
         filename, _ = QFileDialog.getOpenFileName(self, "Open Project", "", "FPGA Builder Project Files (*.fga);;All Files (*)")
         if filename:
-            with open(filename, "r") as file:
-                project_data = json.load(file)
-            self.scene.clear()
-            self.draw_grid()
-            components = {}
-            for component_data in project_data["components"]:
-                component = FPGAComponent(component_data["x"], component_data["y"], 100, 50, component_data["label"], component_data["pin_count"], component_data["pin_orientation"])
-                self.scene.addItem(component)
-                component.setZValue(0) # Ensure components are above connections but below pins
-                components[component_data["label"]] = component
-            for connection_data in project_data["connections"]:
-                source_component = components[connection_data["source_label"]]
-                target_component = components[connection_data["target_label"]]
-                source_pin = source_component.pins[connection_data["source_pin_index"]]
-                target_pin = target_component.pins[connection_data["target_pin_index"]]
-                connection = Connection(source_pin, target_pin)
-                self.scene.addItem(connection)
-                connection.setZValue(-1)  # Ensure connections are below components
+            try:
+                self.read_project(filename)
+            except (KeyError, IndexError, ValueError) as error:
+                QMessageBox.warning(self, "Load Project", "Could not load %s: %s" % (filename, error))
+            self.compact_journal(force=True)
+            if self.collab is not None:
+                self.collab.send_snapshot(self.project_data())
+
+    def write_project(self, filename):
+        with open(filename, "w") as file:
+            json.dump(self.project_data(), file)
+
+    def read_project(self, filename):
+        with open(filename, "r") as file:
+            project_data = json.load(file)
+        self.load_project_data(project_data)
+
+    def project_data(self):
+        project_data = {
+            "version": PROJECT_VERSION,
+            "components": [],
+            "connections": [],
+            "blocks": {name: definition.project_data for name, definition in self.block_definitions.items()}
+        }
+        # Ascending stacking order is insertion order, so a saved file loads
+        # back and saves again unchanged
+        for item in self.scene.items(Qt.AscendingOrder):
+            if isinstance(item, FPGAComponent):
+                project_data["components"].append(item.to_dict())
+            elif isinstance(item, Connection):
+                project_data["connections"].append(item.to_dict())
+        return project_data
+
+    def load_project_data(self, project_data):
+        check_version(project_data)
+        # Drop references to the items that clear() is about to delete
+        self.highlighted_net = set()
+        self.find_results = []
+        self.find_list.clear()
+        self.scene.clear()
+        self.undo_stack = []
+        self.redo_stack = []
+        self.block_definitions = {}
+        self.block_renames = {}
+        for window in self.block_windows.values():
+            window.close()
+        self.block_windows = {}
+        rename_blocks(project_data["components"], register_block_definitions(self.block_definitions,
+                                                                             project_data.get("blocks", {})))
+        populate_scene(self.scene, project_data, self.block_definitions)
+        # Sort the find index now rather than on the first search
+        self.scene.search_index.prepare()
+
+def host_and_port(text):
+    """Parse the HOST:PORT of --join; the host defaults to this machine."""
+    host, _, port = text.rpartition(":")
+    if not port.isdigit() or not 0 < int(port) < 65536:
+        raise argparse.ArgumentTypeError("expected HOST:PORT, such as localhost:8765, not %r" % text)
+    return host or "127.0.0.1", int(port)
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = MainWindow()
+    parser = argparse.ArgumentParser(description="FPGA Builder")
+    parser.add_argument("--profile-startup", action="store_true", help="print how long each step of startup takes")
+    parser.add_argument("--exit-after-startup", action="store_true",
+                        help="quit as soon as startup has finished, without touching the autosave journal")
+    parser.add_argument("--join", metavar="HOST:PORT", type=host_and_port,
+                        help="edit together with others through the collaboration server at HOST:PORT")
+    args, qt_args = parser.parse_known_args()
+    startup = StartupProfile(STARTED)
+    startup.mark("imports")
+    app = QApplication(sys.argv[:1] + qt_args)
+    if os.environ.get("FPGA_BUILDER_PROFILE"):
+        PROFILER.enable()
+    startup.mark("application")
+    window = MainWindow(autosave=not args.exit_after_startup)
+    startup.mark("main window")
+
+    def finish_startup():
+        # Everything the first frame does not need starts once it is on screen
+        window.start_autosave()
+        startup.mark("autosave")
+        if args.profile_startup:
+            sys.stderr.write(startup.report("first frame", FIRST_FRAME_TARGET))
+        if args.exit_after_startup:
+            app.quit()
+            return
+        window.offer_recovery()
+        if args.join:
+            window.join_session(*args.join)
+
+    def first_frame():
+        startup.mark("first frame")
+        QTimer.singleShot(0, finish_startup)
+
+    window.view.first_frame_callback = first_frame
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    sys.exit(app.exec_())
@@ -0,0 +1,140 @@
+# Wire segment index for FPGA Builder.
+#
+# Wires are drawn as horizontal and vertical segments. Horizontal segments
+# are kept in rows keyed by their y coordinate, vertical ones in columns keyed
+# by x, and the row and column keys are kept sorted. Finding the segments in
+# an area, the segments crossing a segment, or the collinear segments on top
+# of each other then only looks at the rows and columns inside the area
+# instead of at every wire. Changing a wire replaces only that wire's
+# segments.
+
+import bisect
+from collections import defaultdict
+
+PRECISION = 3  # Decimal places kept, so rounding noise from rotated parts does not split a row
+
+
+class SegmentIndex:
+    def __init__(self):
+        self.segments = {}  # wire -> [(x1, y1, x2, y2)] with x1 <= x2 and y1 <= y2
+        self.ends = {}  # wire -> the points where the wire starts and ends
+        self.rows = defaultdict(list)  # y -> [(x1, x2, wire)] of horizontal segments
+        self.columns = defaultdict(list)  # x -> [(y1, y2, wire)] of vertical segments
+        self.row_keys = []
+        self.column_keys = []
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __contains__(self, wire):
+        return wire in self.segments
+
+    def set_segments(self, wire, segments):
+        """Replace the segments of wire, given in order from its start to its end.
+
+        Each segment is (x1, y1, x2, y2) and horizontal or vertical.
+        """
+        self.remove(wire)
+        segments = [tuple(round(value, PRECISION) for value in segment) for segment in segments]
+        if segments:
+            self.ends[wire] = {segments[0][:2], segments[-1][2:]}
+        normalized = []
+        for x1, y1, x2, y2 in segments:
+            x1, x2 = min(x1, x2), max(x1, x2)
+            y1, y2 = min(y1, y2), max(y1, y2)
+            if y1 == y2:
+                self._insert(self.rows, self.row_keys, y1, (x1, x2, wire))
+            elif x1 == x2:
+                self._insert(self.columns, self.column_keys, x1, (y1, y2, wire))
+            else:
+                raise ValueError("segment (%s, %s)-(%s, %s) is not horizontal or vertical" % (x1, y1, x2, y2))
+            normalized.append((x1, y1, x2, y2))
+        self.segments[wire] = normalized
+
+    def remove(self, wire):
+        self.ends.pop(wire, None)
+        for x1, y1, x2, y2 in self.segments.pop(wire, ()):
+            if y1 == y2:
+                self._delete(self.rows, self.row_keys, y1, (x1, x2, wire))
+            else:
+                self._delete(self.columns, self.column_keys, x1, (y1, y2, wire))
+
+    def clear(self):
+        self.__init__()
+
+    @staticmethod
+    def _insert(buckets, keys, key, entry):
+        if key not in buckets:
+            bisect.insort(keys, key)
+        buckets[key].append(entry)
+
+    @staticmethod
+    def _delete(buckets, keys, key, entry):
+        bucket = buckets[key]
+        bucket.remove(entry)
+        if not bucket:
+            del buckets[key]
+            del keys[bisect.bisect_left(keys, key)]
+
+    @staticmethod
+    def _keys_between(keys, low, high):
+        return keys[bisect.bisect_left(keys, low):bisect.bisect_right(keys, high)]
+
+    def horizontal_in(self, left, top, right, bottom):
+        """Yield (y, x1, x2, wire) for horizontal segments touching the rectangle."""
+        for y in self._keys_between(self.row_keys, top, bottom):
+            for x1, x2, wire in self.rows[y]:
+                if x1 <= right and x2 >= left:
+                    yield y, x1, x2, wire
+
+    def vertical_in(self, left, top, right, bottom):
+        """Yield (x, y1, y2, wire) for vertical segments touching the rectangle."""
+        for x in self._keys_between(self.column_keys, left, right):
+            for y1, y2, wire in self.columns[x]:
+                if y1 <= bottom and y2 >= top:
+                    yield x, y1, y2, wire
+
+    def wire_at(self, x, y, tolerance):
+        """Return a wire with a segment within tolerance of (x, y), or None."""
+        for _, _, _, wire in self.horizontal_in(x - tolerance, y - tolerance, x + tolerance, y + tolerance):
+            return wire
+        for _, _, _, wire in self.vertical_in(x - tolerance, y - tolerance, x + tolerance, y + tolerance):
+            return wire
+        return None
+
+    def crossings_in(self, left, top, right, bottom):
+        """Yield (x, y, horizontal wire, vertical wire) for segments of two wires meeting in the rectangle.
+
+        Crossings and T-shaped touches are both reported. Two wires that only
+        meet where both of them end, such as two wires leaving the same pin,
+        are not.
+        """
+        for y, x1, x2, wire in self.horizontal_in(left, top, right, bottom):
+            for x in self._keys_between(self.column_keys, max(x1, left), min(x2, right)):
+                for y1, y2, other in self.columns[x]:
+                    if other is not wire and y1 <= y <= y2:
+                        if (x, y) not in self.ends[wire] or (x, y) not in self.ends[other]:
+                            yield x, y, wire, other
+
+    def overlaps_in(self, left, top, right, bottom):
+        """Yield (x1, y1, x2, y2, wire, other) for collinear segments of two wires lying on top of each other."""
+        rows = ((y, self.rows[y]) for y in self._keys_between(self.row_keys, top, bottom))
+        for y, bucket in rows:
+            for start, end, wire, other in self._overlapping(bucket, left, right):
+                yield start, y, end, y, wire, other
+        columns = ((x, self.columns[x]) for x in self._keys_between(self.column_keys, left, right))
+        for x, bucket in columns:
+            for start, end, wire, other in self._overlapping(bucket, top, bottom):
+                yield x, start, x, end, wire, other
+
+    @staticmethod
+    def _overlapping(bucket, low, high):
+        # Sweep the intervals of one row or column in order of their start
+        active = []
+        for start, end, wire in sorted((entry for entry in bucket if entry[0] <= high and entry[1] >= low),
+                                       key=lambda entry: entry[0]):
+            active = [entry for entry in active if entry[1] > start]
+            for other_start, other_end, other in active:
+                if other is not wire:
+                    yield start, min(end, other_end), other, wire
+            active.append((start, end, wire))